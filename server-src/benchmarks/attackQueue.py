@@ -0,0 +1,93 @@
+"""
+Compares the attack queue of the turn engine, a reused deque, against the queue.Queue it was before.
+
+queue.Queue takes a lock on every call and was allocated again every inning, this measures that
+cost on the calls an inning makes and on simulated games.
+
+Run from the server-src folder:
+    python -m benchmarks.attackQueue
+    python -m benchmarks.attackQueue --games 200 --bots 6
+"""
+from server import Server
+from modules.simulation import Simulator
+from modules.turn import TurnHandler
+
+import argparse
+import collections
+import queue
+import timeit
+
+
+class LockedQueue(queue.Queue):
+    """queue.Queue behind the deque methods TurnHandler calls, with the calls it used to make."""
+    def append(self, item):
+        self.put(item)
+
+    def popleft(self):
+        return self.get()
+
+    def clear(self):
+        with self.mutex:
+            self.queue.clear()
+
+    def __len__(self):
+        # TurnHandler used Queue.empty, which takes the lock like qsize does.
+        return 0 if self.empty() else 1
+
+class LockedQueueTurnHandler(TurnHandler):
+    __slots__ = ()
+
+    def new(self, attacker = None):
+        # A new queue every inning, like before.
+        self.attackQueue = LockedQueue()
+        super().new(attacker)
+
+def measureInning(makeQueue, reuse: bool, attacks: int, number: int) -> float:
+    # The calls of an inning: the queue for it, its attacks and the end of inning checks.
+    reused = makeQueue()
+    def inning():
+        attackQueue = reused if reuse else makeQueue()
+        if reuse:
+            attackQueue.clear()
+        for _ in range(attacks):
+            attackQueue.append(None)
+            attackQueue.popleft()
+            len(attackQueue) > 0
+        len(attackQueue) == 0
+
+    return min(timeit.repeat(inning, number=number, repeat=5)) / number
+
+def measureGames(server: Server, botCount: int, games: int, seed: int, locked: bool) -> tuple[float, int]:
+    simulator = Simulator(server, botCount)
+    if locked:
+        simulator.room.turn.__class__ = LockedQueueTurnHandler
+    simulator.reseed(seed)
+    results = simulator.runGames(games)
+    simulator.close()
+    innings = sum(result.innings for result in results)
+    return sum(result.elapsed for result in results) / innings, innings
+
+def main():
+    parser = argparse.ArgumentParser(description="Attack queue benchmark")
+    parser.add_argument('--number', type=int, default=20000, help='Innings per timing run (default: 20000)')
+    parser.add_argument('--attacks', type=int, default=2, help='Attacks per inning of the timing runs (default: 2)')
+    parser.add_argument('--games', type=int, default=200, help='Simulated games per queue (default: 200)')
+    parser.add_argument('--bots', type=int, default=4, help='Bots per game (default: 4)')
+    parser.add_argument('--seed', type=int, default=5, help='Seed of the simulated games (default: 5)')
+    args = parser.parse_args()
+
+    lockedCost = measureInning(LockedQueue, False, args.attacks, args.number)
+    dequeCost = measureInning(collections.deque, True, args.attacks, args.number)
+    print(f"Inning Queue {lockedCost * 1e6:7.2f} us/inning")
+    print(f"Inning deque {dequeCost * 1e6:7.2f} us/inning  speedup: {lockedCost / dequeCost:.2f}x ({args.attacks} attacks)")
+
+    print()
+    server = Server("ANY", "EN", 1)
+    lockedCost, lockedInnings = measureGames(server, args.bots, args.games, args.seed, True)
+    dequeCost, dequeInnings = measureGames(server, args.bots, args.games, args.seed, False)
+    assert lockedInnings == dequeInnings, "The queues played different games!"
+    print(f"Games  Queue {lockedCost * 1e6:7.1f} us/inning")
+    print(f"Games  deque {dequeCost * 1e6:7.1f} us/inning  speedup: {lockedCost / dequeCost:.2f}x, {(lockedCost - dequeCost) * 1e6:.2f} us/inning saved ({dequeInnings} innings)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares ways of encoding the item kinds the turn engine and the bots branch on.
+
+The items keep the plain strings read from the CSV data, this measures them against interned
+strings and integer encodings on an attackKind elif ladder, and against interned strings on
+simulated games.
+
+Run from the server-src folder:
+    python -m benchmarks.itemEncoding
+    python -m benchmarks.itemEncoding --games 200 --bots 6
+"""
+from server import Server
+from modules.item import Item, ItemManager
+from modules.simulation import Simulator
+
+import argparse
+import dataclasses
+import enum
+import sys
+import timeit
+
+
+STRING_FIELDS = ("assistantType", "type", "attackKind", "attackExtra", "defenseKind", "defenseExtra", "attribute")
+
+# The attackKind checks TurnHandler.queueAttack did before reaching the damage, before its handler tables.
+LADDER = ("DO_NOTHING", "DISCARD", "EXCHANGE", "SELL", "BUY", "REMOVE_ITEMS", "REMOVE_ABILITIES", "MYSTERY",
+          "SET_ASSISTANT", "INCREASE_OR_DECREASE_HP", "ADD_ITEM", "ATK")
+
+def copyString(value: str) -> str:
+    # A new string object, as str.split returns them.
+    return (value + ".")[:-1]
+
+def internItems(itemManager: ItemManager):
+    """Replaces every item by a copy whose strings are interned."""
+    def copyItem(item: Item) -> Item:
+        return dataclasses.replace(item, **{name: sys.intern(getattr(item, name)) for name in STRING_FIELDS})
+
+    itemManager.items = [copyItem(item) for item in itemManager.items]
+    itemManager.buildItemIndex()
+    itemManager.itemsByType = dict()
+    for item in itemManager.items:
+        itemManager.itemsByType.setdefault(item.type, []).append(item)
+    itemManager.assistantItems = dict((type, [copyItem(item) for item in items]) for type, items in itemManager.assistantItems.items())
+
+def measureLadder(kinds: list, constants: list, number: int) -> float:
+    # Walks each kind down the ladder until it matches, like the turn engine does.
+    def walk():
+        for kind in kinds:
+            for constant in constants:
+                if kind == constant:
+                    break
+
+    return min(timeit.repeat(walk, number=number, repeat=5)) / number / len(kinds)
+
+def measureGames(server: Server, botCount: int, games: int, seed: int) -> tuple[float, int]:
+    simulator = Simulator(server, botCount)
+    simulator.reseed(seed)
+    results = simulator.runGames(games)
+    simulator.close()
+    innings = sum(result.innings for result in results)
+    return sum(result.elapsed for result in results) / innings, innings
+
+def main():
+    parser = argparse.ArgumentParser(description="Item kind encoding benchmark")
+    parser.add_argument('--number', type=int, default=200, help='Ladder walks per timing run (default: 200)')
+    parser.add_argument('--games', type=int, default=100, help='Simulated games per encoding (default: 100)')
+    parser.add_argument('--bots', type=int, default=4, help='Bots per game (default: 4)')
+    parser.add_argument('--seed', type=int, default=5, help='Seed of the simulated games (default: 5)')
+    args = parser.parse_args()
+
+    itemManager = ItemManager("ItemData.CSV", "AssistantItemData.CSV")
+    kinds = [sys.intern(item.attackKind) for item in itemManager.items]
+
+    # Items without an attack kind have an empty one, which isn't a valid member name.
+    Kind = enum.IntEnum("Kind", [kind or "NONE" for kind in sorted(set(kinds) | set(LADDER))])
+    encodings = [
+        ("str", [copyString(kind) for kind in kinds], [copyString(kind) for kind in LADDER]),
+        ("interned", kinds, list(LADDER)),
+        ("int", [int(Kind[kind or "NONE"]) for kind in kinds], [int(Kind[kind]) for kind in LADDER]),
+        ("IntEnum", [Kind[kind or "NONE"] for kind in kinds], [Kind[kind] for kind in LADDER]),
+    ]
+    for name, values, constants in encodings:
+        print(f"Ladder {name:<9} {measureLadder(values, constants, args.number) * 1e9:7.1f} ns/item")
+
+    print()
+    server = Server("ANY", "EN", 1)
+    plainCost, plainInnings = measureGames(server, args.bots, args.games, args.seed)
+    internItems(server.itemManager)
+    internedCost, internedInnings = measureGames(server, args.bots, args.games, args.seed)
+    assert internedInnings == plainInnings, "The encodings played different games!"
+    print(f"Games  str       {plainCost * 1e6:7.1f} us/inning")
+    print(f"Games  interned  {internedCost * 1e6:7.1f} us/inning  speedup: {plainCost / internedCost:.2f}x ({internedInnings} innings)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares the request parser against the vendored xmltodict on typical client requests.
+
+Run from the server-src folder:
+    python -m benchmarks.requestParser
+"""
+from helpers.xmltodict import parse as xmltodict
+from modules.requestParser import RequestParser, parseRequest
+
+import argparse
+import timeit
+
+REQUESTS = [
+    '<LOGIN><name>Player</name><language>EN</language><oneTimeID>1475196662616</oneTimeID></LOGIN>',
+    '<ENTER><name>Room &amp; Friends</name><playersLimit>4</playersLimit><isFast /></ENTER>',
+    '<ENTER><id>12</id></ENTER>',
+    '<CHAT><comment> Good game! </comment><toTeam /></CHAT>',
+    '<ENTER_GAME><team>TEAM1</team></ENTER_GAME>',
+    '<READY><isReady /></READY>',
+    '<BUY><doBuy /></BUY>',
+    '<COMMAND target="Odin"><piece><item>50</item></piece><piece><item>233</item><illusionItemIndex>0</illusionItemIndex></piece><piece><item>201</item><isAbility /><abilityIndex>1</abilityIndex></piece></COMMAND>',
+    '<COMMAND target="Player"><piece><item>2</item></piece><power key="HP">30</power><power key="MP">30</power><power key="YEN">20</power></COMMAND>',
+    '<COMMAND><piece><item>123</item></piece></COMMAND>',
+    '<COMMAND />',
+    '<EXIT_GAME />',
+    '<EXIT />',
+]
+
+def normalize(value):
+    if isinstance(value, dict):
+        return {key: normalize(child) for key, child in value.items()}
+    if isinstance(value, list):
+        return [normalize(child) for child in value]
+    return value
+
+def parseWithXmltodict(xml: str) -> tuple[str, dict]:
+    # What User.parseXml used to do, with repeated fields turned into lists like parseRequest does.
+    xmldict = xmltodict(xml)
+    request = list(xmldict.keys())[0]
+    fields = normalize(list(xmldict.values())[0] or dict())
+    for field in RequestParser.REPEATED_FIELDS.get(request, []):
+        if field in fields and type(fields[field]) is not list:
+            fields[field] = [fields[field]]
+    return request, fields
+
+def parseLikeBefore(xml: str):
+    # User.parseXml before parseRequest existed.
+    xmldict = xmltodict(xml)
+    request = list(xmldict.keys())[0]
+    xmldict = list(xmldict.values())[0] if list(xmldict.values())[0] != None else dict()
+    return request, xmldict
+
+def main():
+    parser = argparse.ArgumentParser(description="Client request parser benchmark")
+    parser.add_argument('--number', type=int, default=2000, help='Passes over the request list per timing run (default: 2000)')
+    args = parser.parse_args()
+
+    for xml in REQUESTS:
+        assert parseRequest(xml) == parseWithXmltodict(xml), f"Parsers disagree on {xml}!"
+    print(f"Both parsers agree on {len(REQUESTS)} requests.")
+
+    def run(parse):
+        for xml in REQUESTS:
+            parse(xml)
+
+    xmltodictTime = min(timeit.repeat(lambda: run(parseLikeBefore), number=args.number, repeat=5)) / (args.number * len(REQUESTS))
+    parserTime = min(timeit.repeat(lambda: run(parseRequest), number=args.number, repeat=5)) / (args.number * len(REQUESTS))
+    print(f"xmltodict: {xmltodictTime * 1e6:6.2f} us/request  parseRequest: {parserTime * 1e6:6.2f} us/request  speedup: {xmltodictTime / parserTime:.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the XMLBuilder serializers on typical ENTER and COMMAND documents.
+
+Run from the server-src folder:
+    python -m benchmarks.xmlSerializer
+"""
+from helpers.xmlbuilder import XMLBuilder
+
+import argparse
+import timeit
+
+
+def buildEnter() -> XMLBuilder:
+    # Shape of Room.addUser's ENTER when joining a running 4 player game.
+    builder = XMLBuilder("ENTER")
+    bRoom = builder.room
+    for idx in range(4):
+        bRoom.user.name(f"User{idx}")
+    bRoom.name("Room & Friends")
+    bRoom.playersLimit("4")
+    bGame = bRoom.game
+    bGame.inningCount("12")
+    bPlayers = bGame.players
+    for idx in range(4):
+        bPlayer = bPlayers.player
+        bPlayer.name(f"User{idx}")
+        bPlayer.team("SINGLE")
+        bPlayer.isReady
+        bPlayer.power(key="HP")("40")
+        bPlayer.power(key="MP")("10")
+        bPlayer.power(key="YEN")("20")
+        bPlayer.harm("FOG")
+        bAssistant = bPlayer.assistant
+        bAssistant.type("MARS")
+        bAssistant.hp("20")
+    bGame.dealCount("0")
+    bPrivPlayer = bGame.privatePlayer
+    bPrivPlayer.time("1475196662616")
+    for item in range(16):
+        bPrivPlayer.item.item(str(item * 7))
+    for idx in range(3):
+        bAbility = bPrivPlayer.ability
+        bAbility.item(str(200 + idx))
+        bAbility.abilityIndex(str(idx))
+    bGame.attacker.name("User0")
+    return builder
+
+def buildCommand() -> XMLBuilder:
+    # Shape of TurnHandler.doAttack's COMMAND for a weapon combo.
+    builder = XMLBuilder("COMMAND")
+    for item in [50, 233, 261]:
+        bPiece = builder.piece
+        bPiece.item(str(item))
+        bPiece.costMP("4")
+    builder.decidedValue("30")
+    builder.commander.name("User0")
+    builder.target.name("User1")
+    return builder
+
+def measure(build, serializer: str, number: int) -> tuple[float, float]:
+    def buildAndSerialize():
+        builder = build()
+        builder['serializer'] = serializer
+        str(builder)
+
+    builder = build()
+    builder['serializer'] = serializer
+    def serializeOnly():
+        str(builder)
+
+    total = min(timeit.repeat(buildAndSerialize, number=number, repeat=5)) / number
+    serialize = min(timeit.repeat(serializeOnly, number=number, repeat=5)) / number
+    return total, serialize
+
+def main():
+    parser = argparse.ArgumentParser(description="XMLBuilder serializer benchmark")
+    parser.add_argument('--number', type=int, default=2000, help='Documents per timing run (default: 2000)')
+    args = parser.parse_args()
+
+    for name, build in [("ENTER", buildEnter), ("COMMAND", buildCommand)]:
+        fast = build()
+        etree = build()
+        etree['serializer'] = 'etree'
+        assert str(fast) == str(etree), f"Serializers disagree on {name}!"
+
+        fastTotal, fastSerialize = measure(build, 'fast', args.number)
+        etreeTotal, etreeSerialize = measure(build, 'etree', args.number)
+        print(f"{name:<8} build+str  etree: {etreeTotal * 1e6:8.1f} us  fast: {fastTotal * 1e6:8.1f} us  speedup: {etreeTotal / fastTotal:.2f}x")
+        print(f"{name:<8} str only   etree: {etreeSerialize * 1e6:8.1f} us  fast: {fastSerialize * 1e6:8.1f} us  speedup: {etreeSerialize / fastSerialize:.2f}x")
+
+if __name__ == '__main__':
+    main()
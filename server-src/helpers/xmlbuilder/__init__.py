@@ -61,6 +61,10 @@ xml_header = add xml header
             to begining of the document. default = True
 builder = builder class, used for create dcument. Default =
                         xml.etree.ElementTree.TreeBuilder
+serializer = 'fast' writes the document straight into a string buffer,
+             'etree' replays it into `builder` and uses
+             ElementTree.tostring. Both produce the same output.
+             default = 'fast'
 
 Options can be readed by
 
@@ -75,6 +79,29 @@ Happy xml'ing.
 """
 
 
+def _escape_text(text):
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+def _escape_attrib(text):
+    # Same escaping as ElementTree, so both serializers agree.
+    text = _escape_text(text)
+    if "\"" in text:
+        text = text.replace("\"", "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
+
+
 class XMLNode(object):
     __document: Any
     __childs: list[Union['XMLNode', str]]
@@ -123,7 +150,12 @@ class XMLNode(object):
         return self
         
     def __str__(self):
-        return tostring(~self, self.__document()['encoding']).decode(self.__document()['encoding'])
+        document = self.__document()
+        if document['serializer'] == 'fast':
+            parts: list[str] = []
+            self.__write(parts.append, document['tabstep'] if document['formatted'] else None, 0)
+            return "".join(parts)
+        return tostring(~self, document['encoding']).decode(document['encoding'])
     
     def __invert__(self):
         builder = self.__document()['builder']()
@@ -154,6 +186,42 @@ class XMLNode(object):
             
         builder.end(self.__tag)
     
+    def __write(self, append, tabstep, level):
+        if tabstep is not None:
+            tab = "\n" + tabstep * level
+            if level != 0:
+                append(tab)
+        else:
+            tab = ""
+
+        append("<" + self.__tag)
+        for key, val in self.__attrs.items():
+            append(' %s="%s"' % (key, _escape_attrib(val)))
+
+        opened = False
+        hasChildTags = False
+        for child in self.__childs:
+            if isinstance(child, str):
+                if not child:
+                    continue
+                if not opened:
+                    append(">")
+                    opened = True
+                append(_escape_text(child))
+            else:
+                if not opened:
+                    append(">")
+                    opened = True
+                hasChildTags = True
+                child.__write(append, tabstep, level + 1)
+
+        if not opened:
+            append(" />")
+            return
+        if hasChildTags and tab:
+            append(tab)
+        append("</" + self.__tag + ">")
+
     def __lshift__(self, val):
         self.__xml_update([val], {})
         return self
@@ -178,7 +246,8 @@ class XMLBuilder(object):
             'tabstep'  : ' ' * 4,
             'encoding'  : 'utf-8',
             'xml_header' : True,
-            'builder' : TreeBuilder
+            'builder' : TreeBuilder,
+            'serializer' : 'fast'
         }
     
     def __getitem__(self, name):
@@ -8,10 +8,12 @@ if TYPE_CHECKING:
 from modules.attackData import AttackData
 from modules.commandPiece import CommandPiece
 
-import random
+import logging
 
 __all__ = ("Assistant",)
 
+logger = logging.getLogger(__name__)
+
 
 class Assistant:
     type: str
@@ -35,7 +37,7 @@ class Assistant:
 
     @staticmethod
     def createRandom(summoner: Player):
-        return Assistant(summoner, random.choice(Assistant.VALID_TYPES))
+        return Assistant(summoner, summoner.room.rand.choice(Assistant.VALID_TYPES))
 
     def absorbDamage(self, damage: int) -> int:
         self.hp -= damage
@@ -46,14 +48,14 @@ class Assistant:
         return damage
 
     def onAttackOpportunity(self):
-        print(f"{self.summoner.name}'s {self.type} assistant attack!")
+        logger.debug("%s's %s assistant attack!", self.summoner.name, self.type)
 
         if self.type == "EARTH":
             itemList = self.buildEarthAttack()
         elif self.type == "MOON":
             itemList = self.buildMoonAttack()
         else:
-            itemList = [self.server.itemManager.getProbRandomAssistantItem(self.type)]
+            itemList = [self.server.itemManager.getProbRandomAssistantItem(self.room.randGen, self.type)]
 
         target = self.decideAttackTarget(itemList)
         newAttack = AttackData(self.summoner, target, [CommandPiece(item) for item in itemList])
@@ -61,23 +63,23 @@ class Assistant:
         self.room.turn.queueAttack(newAttack, True)
 
     def buildEarthAttack(self) -> list[Item]:
-        secondItem = self.server.itemManager.getProbRandomItem()
+        secondItem = self.server.itemManager.getProbRandomItem(self.room.randGen)
         if secondItem.type != "MAGIC":
             if secondItem.attackKind == "SELL":
-                return [secondItem, self.server.itemManager.getProbRandomItem()]
+                return [secondItem, self.server.itemManager.getProbRandomItem(self.room.randGen)]
             elif secondItem.attackKind in ["ATK", "BUY"]:
                 return [secondItem]
-        itemList = [self.server.itemManager.getProbRandomAssistantItem(self.type)] # ADD_ITEM
+        itemList = [self.server.itemManager.getProbRandomAssistantItem(self.room.randGen, self.type)] # ADD_ITEM
         itemList.append(secondItem)
         return itemList
 
     def buildMoonAttack(self) -> list[Item]:
         secondItem = None
         while secondItem is None or secondItem.type != "MAGIC" or secondItem.defenseExtra in ["FLICK_MAGIC", "BLOCK_WEAPON"]:
-            secondItem = self.server.itemManager.getProbRandomItem()
+            secondItem = self.server.itemManager.getProbRandomItem(self.room.randGen)
         if secondItem.attackExtra not in ["WIDE_ATK", "DOUBLE_ATK"]:
             return [secondItem]
-        itemList = [self.server.itemManager.getProbRandomAssistantItem(self.type)] # ATK
+        itemList = [self.server.itemManager.getProbRandomAssistantItem(self.room.randGen, self.type)] # ATK
         itemList.append(secondItem)
         return itemList
 
@@ -10,10 +10,12 @@ from modules.item import Item
 
 from typing import Optional
 from enum import Enum
-import random
+import logging
 
 __all__ = ("AIProcessor",)
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class EnemyStats:
@@ -30,12 +32,57 @@ class PieceScore(Enum):
     HIGH = 6
     CRITICAL = 7
 
+class HandView:
+    """
+    The pieces and magics of a bot sorted once per decision, its hand and MP don't change while it thinks.
+
+    Its magic pieces are only read, the queries hand out new ones with take.
+    """
+    pieces: list[tuple[CommandPiece, Item]]
+    magics: list[tuple[CommandPiece, Item]]
+    usable: list[tuple[CommandPiece, Item]]
+    byKind: dict[str, list[CommandPiece]]
+    byExtra: dict[str, list[tuple[CommandPiece, Item]]]
+    defenses: list[tuple[CommandPiece, Item]]
+    counters: list[tuple[CommandPiece, Item]]
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, player: Player):
+        self.pieces = [(piece, piece.getItemOrIllusion()) for piece in player.pieces]
+        self.magics = list()
+        for id in player.magics:
+            item = player.server.itemManager.getItem(id)
+            self.magics.append((CommandPiece(item, True), item))
+
+        # Pieces first and then magics, what can be paid with the current MP.
+        self.usable = [(piece, item) for piece, item in self.pieces if item.type != "MAGIC" or player.mp >= item.subValue]
+        self.usable += [(piece, item) for piece, item in self.magics if player.mp >= item.subValue]
+
+        self.byKind = dict()
+        self.byExtra = dict()
+        self.defenses = list()
+        for piece, item in self.usable:
+            if not piece.isAbility:
+                self.byKind.setdefault(item.attackKind, list()).append(piece)
+            self.byExtra.setdefault(item.attackExtra, list()).append((piece, item))
+            if item.defenseKind == "DFS":
+                self.defenses.append((piece, item))
+
+        self.counters = [(piece, item) for piece, item in self.pieces if item.defenseKind == "COUNTER"]
+
+    @staticmethod
+    def take(piece: CommandPiece) -> CommandPiece:
+        """Every query gets its own magic pieces, the chosen ones are changed once they are used."""
+        return CommandPiece(piece.item, True) if piece.isAbility else piece
+
 class AIProcessor:
     player: Player
     room: Room
     server: Server
     enemyStats: dict[str, EnemyStats]
     possiblyDefenseless: list[Player]
+    hand: Optional[HandView]
 
     __slots__ = tuple(__annotations__)
 
@@ -45,6 +92,11 @@ class AIProcessor:
         self.server = player.server
         self.enemyStats = dict()
         self.possiblyDefenseless = list()
+        self.hand = None
+
+    def getHand(self) -> HandView:
+        # Only kept during a decision, anything else may change the hand.
+        return self.hand if self.hand is not None else HandView(self.player)
 
     def checkEnemyStats(self):
         for player in self.room.players:
@@ -79,37 +131,13 @@ class AIProcessor:
 
             stats.lastHP = player.hp
 
-        print(f"Enemy Stats: {self.enemyStats}")
+        logger.debug("Enemy Stats: %s", self.enemyStats)
 
     def getPiecesByAK(self, kind: str) -> list[CommandPiece]:
-        items: list[CommandPiece] = []
-        for piece in self.player.pieces:
-            item = piece.getItemOrIllusion()
-            if item.type == "MAGIC" and self.player.mp < item.subValue:
-                continue
-            if item.attackKind == kind:
-                items.append(piece)
-        return items
+        return list(self.getHand().byKind.get(kind, ()))
 
     def getPiecesByAE(self, extra: str, attr: Optional[str] = None) -> list[CommandPiece]:
-        items: list[CommandPiece] = []
-        for piece in self.player.pieces:
-            item = piece.getItemOrIllusion()
-            if item.type == "MAGIC" and self.player.mp < item.subValue:
-                continue
-            if attr is not None and item.attribute != attr:
-                continue
-            if item.attackExtra == extra:
-                items.append(piece)
-        for id in self.player.magics:
-            item = self.server.itemManager.getItem(id)
-            if self.player.mp < item.subValue:
-                continue
-            if attr is not None and item.attribute != attr:
-                continue
-            if item.attackExtra == extra:
-                items.append(CommandPiece(item, True))
-        return items
+        return [HandView.take(piece) for piece, item in self.getHand().byExtra.get(extra, ()) if attr is None or item.attribute == attr]
 
     def getPiecesDamage(self, damage: int, pieces: list[CommandPiece]) -> int:
         for idx, piece in enumerate(pieces):
@@ -125,33 +153,14 @@ class AIProcessor:
         return damage
 
     def getDefensePieces(self, forAttribute: str) -> list[CommandPiece]:
-        pieces: list[CommandPiece] = []
-        for piece in self.player.pieces:
-            item = piece.getItemOrIllusion()
-            if item.defenseKind != "DFS":
-                continue
-            if item.type == "MAGIC" and self.player.mp < item.subValue:
-                continue
-            if not Item.checkDefense(forAttribute, item.attribute):
-                continue
-            pieces.append(piece)
-        for id in self.player.magics:
-            item = self.server.itemManager.getItem(id)
-            if item.defenseKind != "DFS":
-                continue
-            if self.player.mp < item.subValue:
-                continue
-            if not Item.checkDefense(forAttribute, item.attribute):
-                continue
-            pieces.append(CommandPiece(item, True))
+        pieces = [HandView.take(piece) for piece, item in self.getHand().defenses if Item.checkDefense(forAttribute, item.attribute)]
         return sorted(pieces, key = lambda x: x.getItemOrIllusion().getDef())
 
     def getCounterRings(self, forAttribute: str) -> list[CommandPiece]:
         items: list[CommandPiece] = []
         harms: list[str] = []
-        for piece in self.player.pieces:
-            item = piece.getItemOrIllusion()
-            if item.defenseKind != "COUNTER" or (item.isAtkHarm() and item.attackExtra in harms):
+        for piece, item in self.getHand().counters:
+            if item.isAtkHarm() and item.attackExtra in harms:
                 continue
             if not Item.checkDefense(forAttribute, item.attribute):
                 continue
@@ -162,26 +171,9 @@ class AIProcessor:
 
     def getCounterPieces(self, forAttribute: Optional[str], isCounterAttack: bool, isMagicAttack: bool, isWeaponAttack: bool) -> list[CommandPiece]:
         items: list[CommandPiece] = []
-        for piece in self.player.pieces:
-            item = piece.getItemOrIllusion()
-            if item.type == "MAGIC" and self.player.mp < item.subValue:
-                continue
-            if item.defenseExtra == "REFLECT_ANY":
-                items.append(piece)
-            if (not item.hasSpecialMagicDefense() or not isMagicAttack) and \
-                (not item.hasSpecialWeaponDefense() or not isWeaponAttack):
-                continue
-            if forAttribute is None or forAttribute == "DARK" or isCounterAttack:
-                continue
-            elif "WEAPON" in item.defenseExtra and not Item.checkDefense(forAttribute, item.attribute):
-                continue
-            items.append(piece)
-        for id in self.player.magics:
-            item = self.server.itemManager.getItem(id)
-            if self.player.mp < item.subValue:
-                continue
+        for piece, item in self.getHand().usable:
             if item.defenseExtra == "REFLECT_ANY":
-                items.append(CommandPiece(item, True))
+                items.append(HandView.take(piece))
             if (not item.hasSpecialMagicDefense() or not isMagicAttack) and \
                 (not item.hasSpecialWeaponDefense() or not isWeaponAttack):
                 continue
@@ -189,35 +181,23 @@ class AIProcessor:
                 continue
             elif "WEAPON" in item.defenseExtra and not Item.checkDefense(forAttribute, item.attribute):
                 continue
-            items.append(CommandPiece(item, True))
+            items.append(HandView.take(piece))
         return items
 
     def checkIsItemBadToSell(self, item: Item) -> bool:
-        reallyNeedsMoney = self.player.hp <= 14 and self.player.yen <= 2
-
-        # Magics
-        if item.type == "MAGIC":
+        # Magics, healers, goods and counters
+        if item.isGoodToKeep():
             return True
 
-        # Healers
-        if item.attackKind in ["INCREASE_HP", "INCREASE_MP"]:
-            return True
-        elif item.attackKind in ["REMOVE_ALL_HARMS"]:
+        reallyNeedsMoney = self.player.hp <= 14 and self.player.yen <= 2
+
+        if item.attackKind in ["REMOVE_ALL_HARMS"]:
             if self.player.hasDisease() or not reallyNeedsMoney:
                 return True
         elif item.attackKind in ["REMOVE_LOWER_HARMS"]:
             if self.player.hasLowerDisease() or not reallyNeedsMoney:
                 return True
 
-        # Goods
-        if item.attackExtra in ["SET_ASSISTANT", "ADD_ATTRIBUTE", "INCREASE_ATK", "MAGIC_FREE", "REVIVE", "DYING_ATTACK"]:
-            return True
-
-        # Counters
-        if item.defenseKind in ["COUNTER"] or \
-            item.defenseExtra in ["REFLECT_ANY"]:
-            return True
-
         return False
 
     def getMaxMPForMagic(self, target: Player) -> int:
@@ -260,7 +240,7 @@ class AIProcessor:
     def canBeInstantlyKilledBy(self, defender: Player, pieceOrPieces: CommandPiece | list[CommandPiece], overrideDamage: Optional[int] = None) -> bool:
         if type(pieceOrPieces) is CommandPiece:
             item = pieceOrPieces.getItemOrIllusion()
-            if defender.disease == "HEAVEN" and item.attackExtra in Item.ALL_DISEASES:
+            if defender.disease == "HEAVEN" and item.isAtkDisease():
                 return True
             if not item.attribute:
                 return False
@@ -314,7 +294,11 @@ class AIProcessor:
             assert pieceList[idx].illusionItem is None
 
     def onAttackTurn(self) -> tuple[list[CommandPiece], Player, Optional[dict[str, int]]]:
-        target, pieceList = self.buildAttack()
+        self.hand = HandView(self.player)
+        try:
+            target, pieceList = self.buildAttack()
+        finally:
+            self.hand = None
         self.convertOwnedPiecesToPieces(pieceList)
         decidedExchange = self.buildExchange() if pieceList[0].item.attackKind == "EXCHANGE" else None
         return pieceList, target, decidedExchange
@@ -322,6 +306,8 @@ class AIProcessor:
     def buildAttackPossibilityScores(self) -> dict[PieceScore, list[tuple[Player, CommandPiece | list[CommandPiece]]]]:
         scores: dict[PieceScore, list[tuple[Player, CommandPiece | list[CommandPiece]]]] = dict((score, []) for score in PieceScore)
 
+        hand = self.getHand()
+
         def buildMagicScore(piece: CommandPiece, isBound: bool):
             item = piece.item
             magicFree = self.getPiecesByAE("MAGIC_FREE")
@@ -329,7 +315,7 @@ class AIProcessor:
                 return
 
             # Avoid spamming magics with a low hit rate.
-            if isBound and 0 < item.hitRate < random.randrange(1, 100 + 1):
+            if isBound and 0 < item.hitRate < self.room.rand.randrange(1, 100 + 1):
                 return
 
             # These items can't be used here
@@ -345,7 +331,7 @@ class AIProcessor:
                 else:
                     score = PieceScore.MEDIUM
                 if self.player.mp < item.subValue:
-                    scores[score].append((self.player, [piece, random.choice(magicFree)]))
+                    scores[score].append((self.player, [piece, self.room.rand.choice(magicFree)]))
                 else:
                     scores[score].append((self.player, piece))
                 return
@@ -382,7 +368,7 @@ class AIProcessor:
                             score = PieceScore.MEDIUM
 
                     if score != PieceScore.DISCARD and self.player.mp < item.subValue:
-                        scores[score].append((ally, [piece, random.choice(magicFree)]))
+                        scores[score].append((ally, [piece, self.room.rand.choice(magicFree)]))
                     else:
                         scores[score].append((ally, piece))
             else:
@@ -399,7 +385,7 @@ class AIProcessor:
                             score = PieceScore.ABOVE_MEDIUM
 
                     elif item.attackKind == "ADD_HARM":
-                        isDisease = item.attackExtra in Item.ALL_DISEASES
+                        isDisease = item.isAtkDisease()
                         # TODO: If that could be assured to be possible, we could allow the bot to kill the player by worsening the disease until heaven break.
                         if (isDisease and target.disease == "HELL") or item.attackExtra in target.harms:
                             continue
@@ -407,16 +393,14 @@ class AIProcessor:
                             score = PieceScore.HIGH
 
                     if self.player.mp < item.subValue:
-                        scores[score].append((target, [piece, random.choice(magicFree)]))
+                        scores[score].append((target, [piece, self.room.rand.choice(magicFree)]))
                     else:
                         scores[score].append((target, piece))
 
-        for id in self.player.magics:
-            item = self.server.itemManager.getItem(id)
-            buildMagicScore(CommandPiece(item, True), True)
+        for piece, item in hand.magics:
+            buildMagicScore(HandView.take(piece), True)
 
-        for piece in self.player.pieces:
-            item = piece.getItemOrIllusion()
+        for piece, item in hand.pieces:
             if item.type == "SUNDRY":
                 if item.attackExtra in ["REVIVE", "MORTAR"]:
                     # These items can't be used for direct attacks, and shouldn't be discarded.
@@ -482,8 +466,7 @@ class AIProcessor:
                         else:
                             deadlyPiece: Optional[CommandPiece] = None
                             mostValuablePiece: Optional[CommandPiece] = None
-                            for _piece in self.player.pieces:
-                                _item = _piece.getItemOrIllusion()
+                            for _piece, _item in hand.pieces:
                                 if _piece == piece:
                                     continue
                                 if target.hp + target.mp + target.yen <= _item.price and (deadlyPiece is None or deadlyPiece.getItemOrIllusion().price > _item.price):
@@ -618,7 +601,7 @@ class AIProcessor:
         self.checkEnemyStats()
 
         scores = self.buildAttackPossibilityScores()
-        #print("Attack Possibility Scores:", repr(scores))
+        logger.debug("Attack Possibility Scores: %r", scores)
 
         discardScoresCopy = list(scores[PieceScore.DISCARD])
         for attack in discardScoresCopy:
@@ -636,17 +619,16 @@ class AIProcessor:
             if score == PieceScore.DISCARD:
                 if len(self.player.pieces) == 16:
                     # Discard two items so we can receive new items in the next turn.
-                    print("Bot is full of items! 2 items will be discarded.")
+                    logger.debug("Bot is full of items! 2 items will be discarded.")
                     possibleDiscard = [attack[1] for attack in attackList]
-                    return self.player, [CommandPiece(self.server.itemManager.getItem(1))] + random.sample(possibleDiscard, k = min(2, len(possibleDiscard)))  # type: ignore
+                    return self.player, [CommandPiece(self.server.itemManager.getItem(1))] + self.room.rand.sample(possibleDiscard, k = min(2, len(possibleDiscard)))  # type: ignore
             else:
-                attack = random.choice(attackList)
+                attack = self.room.rand.choice(attackList)
                 assert attack[1], f"{score}, {repr(attack)}"
-                print("Bot target:", attack[0])
+                logger.debug("Bot target: %s", attack[0])
                 return attack[0], attack[1] if type(attack[1]) is list else [attack[1]]  # type: ignore
 
-        print(f"Bot \"{self.player.name}\" couldn't do anything with it's current items.")
-        print(self.player.pieces)
+        logger.debug("Bot \"%s\" couldn't do anything with it's current items. %s", self.player.name, self.player.pieces)
 
         return self.player, [CommandPiece(self.server.itemManager.getItem(0))]
 
@@ -687,7 +669,11 @@ class AIProcessor:
         return decidedExchange
 
     def onDefenseTurn(self) -> list[CommandPiece]:
-        pieceList = self.buildDefense()
+        self.hand = HandView(self.player)
+        try:
+            pieceList = self.buildDefense()
+        finally:
+            self.hand = None
         self.convertOwnedPiecesToPieces(pieceList)
         return pieceList
 
@@ -702,7 +688,7 @@ class AIProcessor:
         attacker = self.room.turn.currentAttack.attacker
         damage = self.room.turn.currentAttack.damage
         attr = self.room.turn.currentAttack.attribute
-        print("Damage:", damage, "| Attr:", attr, "| Attacker:", attacker)
+        logger.debug("Damage: %d | Attr: %s | Attacker: %s", damage, attr, attacker)
 
         if damage <= 0:
             # TODO: Try to reflect, flick or block
@@ -711,7 +697,7 @@ class AIProcessor:
         isCounterAttack = self.room.turn.currentAttack.pieceList[0].item.defenseKind == "COUNTER"
         isMagicAttack = self.room.turn.currentAttack.pieceList[0].item.type == "MAGIC"
         isWeaponAttack = self.room.turn.currentAttack.pieceList[0].item.type == "WEAPON"
-        print("Counter:", isCounterAttack, "| Magic:", isMagicAttack, "| Weapon:", isWeaponAttack)
+        logger.debug("Counter: %s | Magic: %s | Weapon: %s", isCounterAttack, isMagicAttack, isWeaponAttack)
 
         protectors = self.getDefensePieces(attr) if attr is not None else []
         counters = self.getCounterPieces(attr, isCounterAttack, isMagicAttack, isWeaponAttack)
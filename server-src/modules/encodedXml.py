@@ -0,0 +1,44 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Optional
+if TYPE_CHECKING:
+    from autobahn.websocket.protocol import WebSocketServerFactory
+    from autobahn.websocket.types import PreparedMessage
+
+__all__ = ("EncodedXml",)
+
+
+class EncodedXml:
+    """An outgoing message serialized once, so a broadcast can hand the same bytes to every recipient."""
+    data: bytes
+    text: Optional[str]
+    preparedMessage: Optional[PreparedMessage]
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, data: bytes, text: Optional[str] = None):
+        assert data.endswith(b"\0")
+        self.data = data
+        self.text = text
+        self.preparedMessage = None
+
+    def __str__(self):
+        return self.xml
+
+    @staticmethod
+    def fromXml(xml: Any) -> EncodedXml:
+        if isinstance(xml, EncodedXml):
+            return xml
+        text = str(xml)
+        return EncodedXml((text + chr(0)).encode(), text)
+
+    @property
+    def xml(self) -> str:
+        if self.text is None:
+            self.text = self.data[:-1].decode()
+        return self.text
+
+    def getPreparedMessage(self, factory: WebSocketServerFactory) -> PreparedMessage:
+        # The WebSocket frame is built on first use and shared by every WebSocket recipient.
+        if self.preparedMessage is None:
+            self.preparedMessage = factory.prepareMessage(self.data, True)
+        return self.preparedMessage
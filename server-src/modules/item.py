@@ -1,9 +1,12 @@
 from typing import Optional
 from dataclasses import dataclass
+import logging
 import numpy
 import random
 
-__all__ = ("Item", "ItemManager",)
+__all__ = ("Item", "AliasTable", "ItemManager",)
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(frozen=True)
@@ -24,7 +27,23 @@ class Item:
 
     ALL_DISEASES = ["COLD", "FEVER", "HELL", "HEAVEN"]
     ALL_HARMS = ["FOG", "ILLUSION", "GLORY", "DARK_CLOUD"]
-    __slots__ = tuple(__annotations__)
+
+    # Bits of `traits`.
+    ATK_HARM = 1 << 0
+    ATK_DISEASE = 1 << 1
+    DEF_HARM = 1 << 2
+    SPECIAL_WEAPON_DEFENSE = 1 << 3
+    SPECIAL_MAGIC_DEFENSE = 1 << 4
+    AFFECTED_BY_ILLUSION = 1 << 5
+    GOOD_TO_KEEP = 1 << 6
+
+    # `atk`, `defense` and `traits` aren't fields, they're derived from the fields when the item is created.
+    __slots__ = tuple(__annotations__) + ("atk", "defense", "traits")
+
+    def __post_init__(self):
+        object.__setattr__(self, "atk", self.computeAtk())
+        object.__setattr__(self, "defense", self.computeDef())
+        object.__setattr__(self, "traits", self.computeTraits())
 
     @staticmethod
     def fromData(id: int, data: list[str]):
@@ -62,22 +81,47 @@ class Item:
             weight         = int(data[6]) if data[6] else 0
         )
 
+    def computeTraits(self) -> int:
+        traits = 0
+        if self.attackExtra in Item.ALL_DISEASES + Item.ALL_HARMS:
+            traits |= Item.ATK_HARM
+        if self.attackExtra in Item.ALL_DISEASES:
+            traits |= Item.ATK_DISEASE
+        if self.defenseExtra in Item.ALL_DISEASES + Item.ALL_HARMS:
+            traits |= Item.DEF_HARM
+        if self.defenseExtra in ["REFLECT_WEAPON", "FLICK_WEAPON", "BLOCK_WEAPON"]:
+            traits |= Item.SPECIAL_WEAPON_DEFENSE
+        if self.defenseExtra in ["REFLECT_MAGIC", "FLICK_MAGIC", "BLOCK_MAGIC"]:
+            traits |= Item.SPECIAL_MAGIC_DEFENSE
+        if self.type not in ["TRADE", "MAGIC"]:
+            traits |= Item.AFFECTED_BY_ILLUSION
+        # Magics, healers, goods and counters, a bot never sells them whatever its state.
+        if self.type == "MAGIC" or self.attackKind in ["INCREASE_HP", "INCREASE_MP"] or \
+            self.attackExtra in ["SET_ASSISTANT", "ADD_ATTRIBUTE", "INCREASE_ATK", "MAGIC_FREE", "REVIVE", "DYING_ATTACK"] or \
+            self.defenseKind in ["COUNTER"] or self.defenseExtra in ["REFLECT_ANY"]:
+            traits |= Item.GOOD_TO_KEEP
+        return traits
+
     def isAtkHarm(self) -> bool:
-        return self.attackExtra in Item.ALL_DISEASES + Item.ALL_HARMS
+        return self.traits & Item.ATK_HARM != 0
+
+    def isAtkDisease(self) -> bool:
+        return self.traits & Item.ATK_DISEASE != 0
 
     def isDefHarm(self) -> bool:
-        return self.defenseExtra in Item.ALL_DISEASES + Item.ALL_HARMS
+        return self.traits & Item.DEF_HARM != 0
 
     def hasSpecialWeaponDefense(self):
-        return self.defenseExtra in ["REFLECT_WEAPON", "FLICK_WEAPON", "BLOCK_WEAPON"]
+        return self.traits & Item.SPECIAL_WEAPON_DEFENSE != 0
 
     def hasSpecialMagicDefense(self):
-        return self.defenseExtra in ["REFLECT_MAGIC", "FLICK_MAGIC", "BLOCK_MAGIC"]
+        return self.traits & Item.SPECIAL_MAGIC_DEFENSE != 0
 
     def canBeAffectedByIllusion(self) -> bool:
-        if self.type in ["TRADE", "MAGIC"]:
-            return False
-        return True
+        return self.traits & Item.AFFECTED_BY_ILLUSION != 0
+
+    def isGoodToKeep(self) -> bool:
+        return self.traits & Item.GOOD_TO_KEEP != 0
 
     def isSimilarTo(self, other: 'Item') -> bool:
         if self.type in ["TRADE", "MAGIC"]:
@@ -119,6 +163,12 @@ class Item:
         return self.isSimilarTo(other) and other.isSimilarTo(self)
 
     def getAtk(self) -> int:
+        return self.atk
+
+    def getDef(self) -> int:
+        return self.defense
+
+    def computeAtk(self) -> int:
         if self.attackKind == "ATK":
             return self.value
         if self.attackExtra in ["INCREASE_ATK", "ADD_ATTRIBUTE"]:
@@ -128,7 +178,7 @@ class Item:
                 return self.subValue
         return 0
 
-    def getDef(self) -> int:
+    def computeDef(self) -> int:
         if self.defenseKind == "DFS":
             if self.type == "WEAPON":
                 return self.subValue
@@ -159,55 +209,99 @@ class Item:
         return defenseAttr in defenseMapping[attackAttr]
 
 
+class AliasTable:
+    """Walker/Vose alias table for constant-time weighted sampling."""
+    prob: numpy.ndarray
+    alias: numpy.ndarray
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, weights: list[int]):
+        count = len(weights)
+        total = sum(weights)
+        assert count > 0 and total > 0, "AliasTable needs at least one positive weight!"
+
+        # Integer arithmetic keeps zero-weight entries from ever being drawn.
+        scaled = [weight * count for weight in weights]
+        prob = [1.0] * count
+        alias = list(range(count))
+        small = [idx for idx, value in enumerate(scaled) if value < total]
+        large = [idx for idx, value in enumerate(scaled) if value >= total]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            prob[less] = scaled[less] / total
+            alias[less] = more
+            scaled[more] -= total - scaled[less]
+            (small if scaled[more] < total else large).append(more)
+
+        self.prob = numpy.array(prob)
+        self.alias = numpy.array(alias)
+
+    def sample(self, randGen: numpy.random.Generator, count: int) -> list[int]:
+        columns = randGen.integers(0, len(self.prob), size=count)
+        accept = randGen.random(count) < self.prob[columns]
+        return numpy.where(accept, columns, self.alias[columns]).tolist()
+
+
 class ItemManager:
     items: list[Item]
+    itemsById: list[Optional[Item]]
+    itemIds: frozenset[int]
     itemsByType: dict[str, list[Item]]
-    itemsProbabilities: numpy.ndarray
+    illusionsById: list[tuple[int, ...]]
+    itemsSampler: AliasTable
     assistantItems: dict[str, list[Item]]
-    assistantItemsProbabilities: dict[str, numpy.ndarray]
-    randGen: numpy.random.Generator
+    assistantItemsSamplers: dict[str, AliasTable]
 
     __slots__ = tuple(__annotations__)
 
     def __init__(self, dataFilename: str, assistantDataFilename: str):
         self.items = list()
+        self.itemsById = list()
+        self.itemIds = frozenset()
         self.itemsByType = dict()
+        self.illusionsById = list()
         self.assistantItems = dict()
-        self.randGen = numpy.random.default_rng()
 
         self.loadItems(dataFilename)
         self.loadAssistantItems(assistantDataFilename)
 
     def __contains__(self, id: int) -> bool:
-        return any(item.id == id for item in self.items)
+        return id in self.itemIds
 
     def getItem(self, id: int) -> Item:
-        item = next((item for item in self.items if item.id == id), None)
-        assert item is not None, f"Tried to get inexistent item {id}!"
-        return item
-
-    def getIllusionForItem(self, id: int) -> int:
-        item = self.getItem(id)
-        itemsOfSameType = list(self.itemsByType[item.type])
-        random.shuffle(itemsOfSameType)
-        for chosen in itemsOfSameType:
-            if item.id == chosen.id or chosen.weight == 0:
-                continue
-            if item.isReplaceableBy(chosen):
-                return chosen.id
-        return id
-
-    def getProbRandomItems(self, count: int) -> list[Item]:
-        if count == 0:
-            return []
-        return self.randGen.choice(self.items, count, p = self.itemsProbabilities) # type: ignore
+        assert id in self.itemIds, f"Tried to get inexistent item {id}!"
+        return self.itemsById[id] # type: ignore
 
-    def getProbRandomItem(self) -> Item:
-        return self.randGen.choice(self.items, 1, p = self.itemsProbabilities)[0] # type: ignore
+    def getIllusionForItem(self, rand: random.Random, id: int) -> int:
+        assert id in self.itemIds, f"Tried to get inexistent item {id}!"
+        candidates = self.illusionsById[id]
+        if len(candidates) == 0:
+            return id
+        return rand.choice(candidates)
 
-    def getProbRandomAssistantItem(self, assistantType: str) -> Item:
+    def getProbRandomItems(self, randGen: numpy.random.Generator, count: int) -> list[Item]:
+        if count == 0:
+            return []
+        return [self.items[idx] for idx in self.itemsSampler.sample(randGen, count)]
+
+    def getProbRandomItemsBatch(self, randGen: numpy.random.Generator, counts: list[int]) -> list[list[Item]]:
+        """Draws several deals at once, one list of items per requested count."""
+        drawn = self.getProbRandomItems(randGen, sum(counts))
+        batch: list[list[Item]] = []
+        start = 0
+        for count in counts:
+            batch.append(drawn[start:start + count])
+            start += count
+        return batch
+
+    def getProbRandomItem(self, randGen: numpy.random.Generator) -> Item:
+        return self.items[self.itemsSampler.sample(randGen, 1)[0]]
+
+    def getProbRandomAssistantItem(self, randGen: numpy.random.Generator, assistantType: str) -> Item:
         assert assistantType in self.assistantItems
-        return self.randGen.choice(self.assistantItems[assistantType], 1, p = self.assistantItemsProbabilities[assistantType])[0] # type: ignore
+        return self.assistantItems[assistantType][self.assistantItemsSamplers[assistantType].sample(randGen, 1)[0]]
 
     def loadItems(self, dataFilename: str):
         itemWeights = []
@@ -218,10 +312,28 @@ class ItemManager:
                 self.itemsByType.setdefault(item.type, []).append(item)
                 itemWeights.append(item.weight)
 
-        self.itemsProbabilities = numpy.array(list(map(float, itemWeights)))
-        self.itemsProbabilities = self.itemsProbabilities / sum(itemWeights)
+        self.buildItemIndex()
+        self.buildIllusionTable()
+
+        self.itemsSampler = AliasTable(itemWeights)
+
+        logger.info("ItemManager: Loaded %d items", len(self.items))
+
+    def buildItemIndex(self):
+        # Dense id-indexed table, so lookups don't depend on the item count.
+        self.itemsById = [None] * (max((item.id for item in self.items), default=-1) + 1)
+        for item in self.items:
+            self.itemsById[item.id] = item
+        self.itemIds = frozenset(item.id for item in self.items)
 
-        print(f"ItemManager: Loaded {len(self.items)} items")
+    def buildIllusionTable(self):
+        # Every item an illusion may turn each item into, so dealing doesn't have to search for one.
+        self.illusionsById = [()] * len(self.itemsById)
+        for item in self.items:
+            self.illusionsById[item.id] = tuple(
+                chosen.id for chosen in self.itemsByType[item.type]
+                if item.id != chosen.id and chosen.weight != 0 and item.isReplaceableBy(chosen)
+            )
 
     def loadAssistantItems(self, dataFilename: str):
         itemWeights = {}
@@ -235,9 +347,8 @@ class ItemManager:
                 assistantItemList.append(item)
                 assistantItemWeights.append(item.weight)
 
-        self.assistantItemsProbabilities = {}
+        self.assistantItemsSamplers = {}
         for type, items in itemWeights.items():
-            self.assistantItemsProbabilities[type] = numpy.array(list(map(float, items)))
-            self.assistantItemsProbabilities[type] = self.assistantItemsProbabilities[type] / sum(items)
+            self.assistantItemsSamplers[type] = AliasTable(items)
 
-        print(f"ItemManager: Loaded {len(self.assistantItems)} assistant items")
\ No newline at end of file
+        logger.info("ItemManager: Loaded %d assistant items", len(self.assistantItems))
\ No newline at end of file
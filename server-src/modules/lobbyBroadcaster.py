@@ -0,0 +1,96 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+if TYPE_CHECKING:
+    from twisted.internet.interfaces import IDelayedCall
+    from server import Server
+    from modules.session import Session
+    from modules.encodedXml import EncodedXml
+
+from twisted.internet import reactor
+
+__all__ = ("LobbyBroadcaster",)
+
+
+class LobbyBroadcaster:
+    """
+    Queues the lobby events and sends them to the lobby users once per tick.
+
+    An event can be keyed, and a later event that cancels that key drops both while the first
+    one is still queued, so a user who logs in and out within a tick is never sent to anyone.
+    """
+    server: Server
+    tick: float
+    events: list[Optional[EncodedXml]]
+    pending: dict[tuple, int]
+    subjects: dict[str, list[int]]
+    entrants: dict[Session, int]
+    flushCall: Optional[IDelayedCall]
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, server: Server, tick: float):
+        assert tick > 0
+        self.server = server
+        self.tick = tick
+        self.events = list()
+        self.pending = dict()
+        self.subjects = dict()
+        self.entrants = dict()
+        self.flushCall = None
+
+    def queue(self, encoded: EncodedXml, key: Optional[tuple] = None, cancels: Optional[tuple] = None, subject: Optional[str] = None):
+        """`key` and `cancels` end with the name of the user or player the event is about."""
+        if key is not None:
+            subject = key[-1]
+        elif cancels is not None:
+            subject = cancels[-1]
+            if self.cancel(cancels):
+                return
+
+        idx = len(self.events)
+        self.events.append(encoded)
+        if key is not None:
+            self.pending[key] = idx
+        if subject is not None:
+            self.subjects.setdefault(subject, list()).append(idx)
+
+        if self.flushCall is None:
+            self.flushCall = reactor.callLater(self.tick, self.flush)
+
+    def cancel(self, key: tuple) -> bool:
+        idx = self.pending.pop(key, None)
+        if idx is None:
+            return False
+        subjectEvents = self.subjects[key[-1]]
+        # Only if nothing queued since depends on it, and nobody in the lobby got a snapshot with its effect.
+        if subjectEvents[-1] != idx:
+            return False
+        if any(start > idx and session.state == "LOBBY" for session, start in self.entrants.items()):
+            return False
+        subjectEvents.pop()
+        self.events[idx] = None
+        return True
+
+    def addEntrant(self, session: Session):
+        # The lobby snapshot the session just got already includes everything queued so far.
+        self.entrants[session] = len(self.events)
+
+    def removeEntrant(self, session: Session):
+        self.entrants.pop(session, None)
+
+    def flush(self):
+        self.flushCall = None
+        events, entrants = self.events, self.entrants
+        self.events = list()
+        self.pending = dict()
+        self.subjects = dict()
+        self.entrants = dict()
+
+        # Sent one by one, every event stays a message of its own. Each user's outbox still
+        # writes them at once, and the events are encoded once for everyone.
+        for user in self.server.users.values():
+            if user.state != "LOBBY":
+                continue
+            for encoded in events[entrants.get(user, 0):]:
+                if encoded is not None:
+                    user.sendEncodedXml(encoded)
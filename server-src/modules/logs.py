@@ -0,0 +1,63 @@
+from __future__ import annotations
+from typing import Optional
+from logging.handlers import QueueHandler, QueueListener
+
+import atexit
+import logging
+import queue
+import sys
+
+__all__ = ("PROTOCOL_LOGGER", "setupLogging", "stopBackgroundWriter", "setLogLevel",)
+
+
+# SEND/RECV tracing of every message, kept on its own logger so it can be toggled at runtime.
+PROTOCOL_LOGGER = "protocol"
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+listener: Optional[QueueListener] = None
+
+def setupLogging(level: str = "INFO", traceProtocol: bool = False, background: bool = False):
+    """
+    Configures the server loggers.
+
+    With `background`, records are handed to a queue and written by a separate thread,
+    so a slow stdout doesn't stall the reactor.
+    """
+    global listener
+
+    streamHandler = logging.StreamHandler(sys.stdout)
+    streamHandler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    rootLogger = logging.getLogger()
+    for handler in list(rootLogger.handlers):
+        rootLogger.removeHandler(handler)
+
+    stopBackgroundWriter()
+
+    if background:
+        recordQueue: queue.SimpleQueue = queue.SimpleQueue()
+        rootLogger.addHandler(QueueHandler(recordQueue))
+        listener = QueueListener(recordQueue, streamHandler)
+        listener.start()
+        atexit.register(stopBackgroundWriter)
+    else:
+        rootLogger.addHandler(streamHandler)
+
+    rootLogger.setLevel(level.upper())
+    logging.getLogger(PROTOCOL_LOGGER).setLevel(logging.DEBUG if traceProtocol else logging.INFO)
+
+def stopBackgroundWriter():
+    """Flushes and stops the background writer thread, if there's one."""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+def setLogLevel(name: str, level: str) -> bool:
+    """Changes the level of a logger ("root", "protocol", "modules.turn"...) at runtime."""
+    levelNumber = logging.getLevelName(level.upper())
+    if not isinstance(levelNumber, int):
+        return False
+    logging.getLogger(None if name == "root" else name).setLevel(levelNumber)
+    return True
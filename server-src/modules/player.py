@@ -9,11 +9,14 @@ from modules.item import Item
 from modules.bot import AIProcessor
 from modules.assistant import Assistant
 from modules.commandPiece import CommandPiece
+from modules.templates import Templates
 
-import random
+import logging
 
 __all__ = ("Player",)
 
+logger = logging.getLogger(__name__)
+
 
 class Player:
     name: str
@@ -160,7 +163,7 @@ class Player:
         if self.disease == "HEAVEN":
             self.takeDamage(999)
             self.worseChance = 0
-            print(f"\"{self.name}\": FALL FROM THE HEAVEN!")
+            logger.debug("\"%s\": FALL FROM THE HEAVEN!", self.name)
             return
 
         if harm in Item.ALL_DISEASES:
@@ -170,10 +173,10 @@ class Player:
             else:
                 self.disease = harm
             self.worseChance = 0
-            print(f"\"{self.name}\" got disease: {self.disease}")
+            logger.debug("\"%s\" got disease: %s", self.name, self.disease)
         elif harm not in self.harms:
             self.harms.append(harm)
-            print(f"\"{self.name}\" got harm: {harm}")
+            logger.debug("\"%s\" got harm: %s", self.name, harm)
 
     def unillusionPieces(self):
         builder = XMLBuilder("UNILLUSION")
@@ -197,7 +200,7 @@ class Player:
 
     def removeAllHarms(self, onlyLower: bool = False):
         if not onlyLower:
-            print(f"\"{self.name}\": Remove all harms")
+            logger.debug("\"%s\": Remove all harms", self.name)
             if "ILLUSION" in self.harms:
                 self.pendingUnillusion = True
             if "FOG" in self.harms:
@@ -207,7 +210,7 @@ class Player:
             self.harms = []
             return
 
-        print(f"\"{self.name}\": Remove lower harms")
+        logger.debug("\"%s\": Remove lower harms", self.name)
         if self.disease in ["COLD", "FEVER"]:
             self.disease = ""
             self.worseChance = 0
@@ -221,26 +224,24 @@ class Player:
         assert id in self.server.itemManager
 
         if len(self.pieces) == 16:
-            print(f"{self.name} deal failed because hand is full")
+            logger.debug("%s deal failed because hand is full", self.name)
             return False
 
-        print(f"{self.name} deal {id}")
+        logger.debug("%s deal %d", self.name, id)
         piece = CommandPiece(self.server.itemManager.getItem(id))
 
         if "ILLUSION" in self.harms and piece.item.canBeAffectedByIllusion() and not isAction:
             illusionId = id
-            if random.randrange(0, 2) == 1:
-                illusionId = self.server.itemManager.getIllusionForItem(id)
+            if self.room.rand.randrange(0, 2) == 1:
+                illusionId = self.server.itemManager.getIllusionForItem(self.room.rand, id)
             piece.illusionItem = self.server.itemManager.getItem(illusionId)
             if illusionId != id:
-                print(f"{self.name} previous deal was afflicted by illusion and became {illusionId}")
+                logger.debug("%s previous deal was afflicted by illusion and became %d", self.name, illusionId)
 
         self.pieces.append(piece)
 
         if not isAction and self.session is not None:
-            builder = XMLBuilder("DEAL")
-            builder.item(str(piece.getItemOrIllusion().id))
-            self.session.sendXml(builder)
+            self.session.sendEncodedXml(Templates.DEAL.render(str(piece.getItemOrIllusion().id)))
 
         return True
 
@@ -257,19 +258,19 @@ class Player:
     def getRandomPiece(self) -> Optional[CommandPiece]:
         if len(self.pieces) == 0:
             return None
-        return random.choice(self.pieces)
+        return self.room.rand.choice(self.pieces)
 
     def getRandomMagic(self) -> int:
         if len(self.magics) == 0:
             return 0
-        return random.choice(self.magics)
+        return self.room.rand.choice(self.magics)
 
     def discardPiece(self, ownedPiece: CommandPiece) -> bool:
         if not self.hasOwnedPiece(ownedPiece):
-            print(self.pieces)
+            logger.error("\"%s\" pieces: %s", self.name, self.pieces)
             assert False, f"\"{self.name}\" tried to discard piece ({ownedPiece}) that he doesn't have"
 
-        print(f"{self.name} discard piece {ownedPiece}")
+        logger.debug("%s discard piece %s", self.name, ownedPiece)
         self.pieces.remove(ownedPiece)
         return True
 
@@ -277,7 +278,7 @@ class Player:
         if not self.hasMagic(id):
             assert False, f"\"{self.name}\" tried to discard magic (id {id}) that he doesn't have"
 
-        print(f"{self.name} discard magic {id}")
+        logger.debug("%s discard magic %d", self.name, id)
         self.magics.remove(id)
         return True
 
@@ -298,7 +299,7 @@ class Player:
 
     def usePiece(self, ownedPiece: CommandPiece, noMPCost: bool):
         if not self.hasOwnedPiece(ownedPiece):
-            print(self.pieces)
+            logger.error("\"%s\" pieces: %s", self.name, self.pieces)
             assert False, f"\"{self.name}\" tried to use an piece ({ownedPiece}) that he doesn't have"
 
         item = ownedPiece.item
@@ -316,7 +317,7 @@ class Player:
 
     def useMagic(self, id: int, noMPCost: bool):
         if not self.hasMagic(id):
-            print(self.magics)
+            logger.error("\"%s\" magics: %s", self.name, self.magics)
             assert False, f"\"{self.name}\" tried to use an magic ({id}) that he doesn't have"
 
         item = self.server.itemManager.getItem(id)
@@ -0,0 +1,78 @@
+from __future__ import annotations
+from typing import Any, Optional
+from xml.parsers import expat
+
+__all__ = ("RequestParser", "parseRequest",)
+
+
+class RequestParser:
+    """
+    Builds a client request into its name and a plain dict of its fields.
+
+    Elements with only text become strings, empty elements become None and attributes are prefixed
+    with "@", the same shape xmltodict produced, so the request handlers read it as before.
+    """
+    request: Optional[str]
+    fields: Optional[dict]
+    stack: list[list[Any]]
+
+    # Child elements a request may repeat, these are always returned as lists.
+    REPEATED_FIELDS = {
+        "COMMAND": frozenset(["piece", "power"]),
+    }
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self):
+        self.request = None
+        self.fields = None
+        self.stack = list()
+
+    def parse(self, xml: str) -> tuple[str, dict]:
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.startElement
+        parser.EndElementHandler = self.endElement
+        parser.CharacterDataHandler = self.characterData
+        parser.Parse(xml, True)
+        assert self.request is not None
+        return self.request, self.fields if self.fields is not None else dict()
+
+    def startElement(self, tag: str, attrs: dict[str, str]):
+        # [tag, fields, text]
+        self.stack.append([tag, dict(("@" + key, value) for key, value in attrs.items()) if attrs else None, ""])
+
+    def characterData(self, text: str):
+        self.stack[-1][2] += text
+
+    def endElement(self, tag: str):
+        _, fields, text = self.stack.pop()
+        text = text.strip()
+        if fields is None:
+            value = text if text else None
+        else:
+            if text:
+                fields["#text"] = text
+            value = fields
+
+        if len(self.stack) == 0:
+            self.request = tag
+            self.fields = value if type(value) is dict else None
+            return
+
+        parent = self.stack[-1]
+        if parent[1] is None:
+            parent[1] = dict()
+        parentFields = parent[1]
+        if len(self.stack) == 1 and tag in RequestParser.REPEATED_FIELDS.get(parent[0], ()):
+            parentFields.setdefault(tag, []).append(value)
+        elif tag in parentFields:
+            previous = parentFields[tag]
+            if type(previous) is list:
+                previous.append(value)
+            else:
+                parentFields[tag] = [previous, value]
+        else:
+            parentFields[tag] = value
+
+def parseRequest(xml: str) -> tuple[str, dict]:
+    return RequestParser().parse(xml)
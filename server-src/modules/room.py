@@ -1,17 +1,27 @@
 # -*- coding: cp1252 -*-
 from __future__ import annotations
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Iterator, Optional
 if TYPE_CHECKING:
+    from twisted.internet.interfaces import IDelayedCall
     from server import Server
     from modules.session import Session
 from helpers.xmlbuilder import XMLBuilder
+from modules.encodedXml import EncodedXml
+from modules.templates import Templates
 from modules.player import Player
 from modules.turn import TurnHandler
 
+from twisted.internet import reactor
+import logging
+import numpy
 import random
+import secrets
+import time
 
 __all__ = ("Room",)
 
+logger = logging.getLogger(__name__)
+
 
 class Room:
     server: Server
@@ -32,12 +42,21 @@ class Room:
     handledAssistantThisTurn: bool
     teamPlay: bool
     turn: TurnHandler
+    inningSteps: Optional[Iterator[None]]
+    resumeCall: Optional[IDelayedCall]
     forceNextDeal: Optional[int]
     forceInitialDeal: Optional[list[int]]
     fdIncludeBots: bool
     forceNextAssistant: Optional[str]
+    forceSeed: Optional[int]
+    seed: int
+    rand: random.Random
+    randGen: numpy.random.Generator
     users: list[Session]
     players: list[Player]
+    playersByName: dict[str, Player]
+    alivePlayers: list[Player]
+    aliveTeamCounts: dict[str, int]
 
     VALID_TEAMS = ["TEAM1", "TEAM2", "TEAM3", "TEAM4"]
     __slots__ = tuple(__annotations__)
@@ -64,18 +83,32 @@ class Room:
         self.teamPlay = bool()
 
         self.turn = TurnHandler(self)
+        self.inningSteps = None
+        self.resumeCall = None
 
         self.forceNextDeal = None
         self.forceInitialDeal = None
         self.fdIncludeBots = False
         self.forceNextAssistant = None
+        self.forceSeed = None
+
+        # Every random decision of a game comes from these, so a game can be replayed from its seed.
+        self.rand = random.Random()
+        self.reseed(secrets.randbits(63))
 
         self.users = list()
         self.players = list()
+        self.playersByName = dict()
+        # Kept in the order of `players`, so picking a random alive player doesn't depend on who died first.
+        self.alivePlayers = list()
+        self.aliveTeamCounts = dict()
 
     def broadXml(self, xml):
+        if len(self.users) == 0:
+            return
+        encoded = EncodedXml.fromXml(xml)
         for user in self.users:
-            user.sendXml(xml)
+            user.sendEncodedXml(encoded)
 
     def sendChat(self, sender: str, msg: str, toTeam: str):
         builder = XMLBuilder("CHAT")
@@ -83,43 +116,91 @@ class Room:
         builder.comment(msg)
         if toTeam:
             builder.toTeam
+            encoded = EncodedXml.fromXml(builder)
             for player in self.players:
                 if player.session is None or player.team != toTeam:
                     continue
-                player.session.sendXml(builder)
+                player.session.sendEncodedXml(encoded)
         else:
             self.broadXml(builder)
 
+    def reseed(self, seed: int):
+        self.seed = seed
+        self.rand.seed(seed)
+        self.randGen = numpy.random.default_rng(seed)
+
     def getPlayer(self, name: str) -> Optional[Player]:
-        for player in self.players:
-            if player.name == name:
-                return player
-        return None
+        return self.playersByName.get(name)
+
+    def addPlayer(self, player: Player):
+        self.players.append(player)
+        # Names may repeat, a training bot can be named like the user, getPlayer finds the first one.
+        self.playersByName.setdefault(player.name, player)
+        self.rebuildAlive()
+        self.server.indexPlayer(player.name, self)
+        self.server.invalidateLobby()
+
+    def removePlayer(self, player: Player):
+        if self.playing:
+            # The rest of the game can't be played without them.
+            self.stopAdvancing()
+        self.players.remove(player)
+        if self.playersByName.get(player.name) is player:
+            del self.playersByName[player.name]
+            for other in self.players:
+                if other.name == player.name:
+                    self.playersByName[player.name] = other
+                    break
+        self.rebuildAlive()
+        if player.name not in self.playersByName:
+            self.server.unindexPlayer(player.name, self)
+        self.server.invalidateLobby()
+
+    def setPlayerTeam(self, player: Player, team: str):
+        player.team = team
+        self.rebuildAlive()
+
+    def rebuildAlive(self):
+        """Recounts the alive players, for changes other than a death: players added or removed, teams or a new game."""
+        self.alivePlayers = [player for player in self.players if not player.dead]
+        self.aliveTeamCounts = dict()
+        for player in self.alivePlayers:
+            self.aliveTeamCounts[player.team] = self.aliveTeamCounts.get(player.team, 0) + 1
+
+    def setPlayerDead(self, player: Player):
+        assert not player.dead
+        player.dead = True
+        self.alivePlayers.remove(player)
+        self.aliveTeamCounts[player.team] -= 1
+        if self.aliveTeamCounts[player.team] == 0:
+            del self.aliveTeamCounts[player.team]
 
     def getRandomAlive(self, me: Optional[Player] = None) -> Player:
-        return random.choice([player for player in self.players if not player.dead and player != me])
+        return self.rand.choice([player for player in self.alivePlayers if player != me])
 
     def getRandomAliveEnemy(self, me: Player) -> Player:
-        return random.choice([player for player in self.players if not player.dead and player.isEnemy(me)])
+        return self.rand.choice([player for player in self.alivePlayers if player.isEnemy(me)])
 
     def getRandomAliveAlly(self, me: Player, exceptMe: bool = True) -> Player:
-        return random.choice([player for player in self.players if not player.dead and (not exceptMe or player != me) and not player.isEnemy(me)])
+        return self.rand.choice([player for player in self.alivePlayers if (not exceptMe or player != me) and not player.isEnemy(me)])
 
     def getAliveCount(self) -> int:
-        return sum(not player.dead for player in self.players)
+        return len(self.alivePlayers)
 
     def getAliveTeams(self) -> list[str]:
-        aliveTeams = []
-        for player in self.players:
-            if not player.dead and player.team not in aliveTeams:
-                aliveTeams.append(player.team)
-        return aliveTeams
+        return list(self.aliveTeamCounts)
+
+    def isTeamAlive(self, team: str) -> bool:
+        return team in self.aliveTeamCounts
 
     def getTeamsAliveCount(self) -> int:
-        return len(self.getAliveTeams())
+        return len(self.aliveTeamCounts)
 
     def areEnemiesAlive(self, me: Player) -> bool:
-        return any(player.isEnemy(me) and not player.dead for player in self.players)
+        # Every other player is an enemy of a SINGLE player, else the enemies are the players of other teams.
+        if me.team == "SINGLE":
+            return len(self.alivePlayers) - (not me.dead) > 0
+        return len(self.alivePlayers) - self.aliveTeamCounts.get(me.team, 0) > 0
 
     def checkEndGame(self) -> bool:
         getAliveCount = self.getTeamsAliveCount if self.teamPlay else self.getAliveCount
@@ -194,13 +275,14 @@ class Room:
 
         session.state = "ROOM"
         self.users.append(session)
+        self.server.invalidateLobby()
 
-        builder = XMLBuilder("ADD_USER")
-        builder.user.name(session.userName)
-        self.broadXml(builder)
+        self.broadXml(Templates.ADD_USER.render(session.userName))
 
         # For Broadcasting to Lobby
         if roomCreate:
+            builder = XMLBuilder("ADD_USER")
+            builder.user.name(session.userName)
             bRoom = builder.room
             bRoom.name(self.name)
             bRoom.id(str(self.id))
@@ -209,30 +291,25 @@ class Room:
             if self.fast:
                 bRoom.isFast(str(self.fast))
             bRoom.time(str(self.time))
+            self.server.lobbyBroadXml(builder, subject=session.userName)
         else:
-            builder.roomID(str(self.id))
-
-        self.server.lobbyBroadXml(builder)
+            self.server.lobbyBroadXml(Templates.LOBBY_ADD_USER.render(session.userName, str(self.id)), key=("ROOM_USER", self.id, session.userName))
 
     def removeUser(self, session: Session):
         if session not in self.users:
             return
 
         self.users.remove(session)
+        self.server.invalidateLobby()
 
         if len(self.users) == 0:
             # Destroy Room
-            del self.server.rooms[self.id]
+            self.server.removeRoom(self)
         else:
-            builder = XMLBuilder("REMOVE_USER")
-            builder.name(session.userName)
-            self.broadXml(builder)
+            self.broadXml(Templates.ROOM_REMOVE_USER.render(session.userName))
 
         # Broadcast to Lobby
-        builder = XMLBuilder("REMOVE_USER")
-        builder.roomID(str(self.id))
-        builder.user.name(session.userName)
-        self.server.lobbyBroadXml(builder)
+        self.server.lobbyBroadXml(Templates.LOBBY_REMOVE_USER.render(str(self.id), session.userName), cancels=("ROOM_USER", self.id, session.userName))
 
     def enterGame(self, session: Session, team: str):
         assert team in ["SINGLE"] + Room.VALID_TEAMS
@@ -248,11 +325,12 @@ class Room:
 
         if player is None:
             player = Player(self, session, team)
-            self.players.append(player)
+            self.addPlayer(player)
         else:
-            player.team = team
+            self.setPlayerTeam(player, team)
+            self.server.invalidateLobby()
 
-        print(f"Add player: {session.userName}@{team}")
+        logger.info("Add player: %s@%s", session.userName, team)
 
         builder = XMLBuilder("ADD_PLAYER")
         bPlayer = builder.player
@@ -262,7 +340,7 @@ class Room:
 
         # Reuse builder to broadcast to lobby
         builder.roomID(str(self.id))
-        self.server.lobbyBroadXml(builder)
+        self.server.lobbyBroadXml(builder, subject=player.name)
 
         return player
 
@@ -270,13 +348,17 @@ class Room:
         if player not in self.players:
             return
 
-        print("Remove player:", player.name)
+        logger.info("Remove player: %s", player.name)
 
         if self.playing and (len(self.users) > 1 or player.session not in self.users):
             player.session = None
             player.enableAIProcessor()
             assert player.aiProcessor is not None
 
+            if self.isAdvancing():
+                # The game isn't waiting for anyone, the AI plays when it's this player's turn.
+                return
+
             endInning = False
             atkData = self.turn.currentAttack
             if atkData is None:
@@ -289,7 +371,7 @@ class Room:
             if endInning:
                 self.nextInning()
         else:
-            self.players.remove(player)
+            self.removePlayer(player)
 
             builder = XMLBuilder("REMOVE_PLAYER")
             builder.player.name(player.name)
@@ -297,7 +379,7 @@ class Room:
 
             # Reuse builder to broadcast to lobby
             builder.roomID(str(self.id))
-            self.server.lobbyBroadXml(builder)
+            self.server.lobbyBroadXml(builder, subject=player.name)
 
     def shuffleTeam(self):
         if self.playing or not self.teamPlay:
@@ -308,7 +390,7 @@ class Room:
         # To be honest, I don't know how this should be implemented, the below implementation is just a guess.
         # TODO: Improve this.
         players = list(self.players)
-        random.shuffle(players)
+        self.rand.shuffle(players)
 
         for idx, player in enumerate(players):
             assert player.session is not None
@@ -341,8 +423,13 @@ class Room:
         if self.playing:
             return
 
+        self.reseed(self.forceSeed if self.forceSeed is not None else secrets.randbits(63))
+        self.forceSeed = None
+        logger.info("Room %d game started with seed %d", self.id, self.seed)
+
         self.inningCount = -1
         self.playing = True
+        self.server.invalidateLobby()
         self.ended = False
         self.handledDiseaseThisTurn = True
         self.handledAssistantThisTurn = True
@@ -350,6 +437,7 @@ class Room:
         for player in self.players:
             player.reset()
             player.ready = True
+        self.rebuildAlive()
 
         self.attackOrder = -1
 
@@ -366,6 +454,7 @@ class Room:
     def endGame(self):
         #self.playing = False
         self.ended = True
+        self.stopAdvancing()
 
         for player in self.players:
             if "ILLUSION" in player.harms:
@@ -376,13 +465,12 @@ class Room:
 
     def resetAttackOrder(self):
         self.attackOrderList = list(self.players)
-        random.shuffle(self.attackOrderList)
+        self.rand.shuffle(self.attackOrderList)
 
         for player in self.players:
             player.waitingAttackTurn = True
 
-        builder = XMLBuilder("RESET_ATTACK_ORDER")
-        self.broadXml(builder)
+        self.broadXml(Templates.RESET_ATTACK_ORDER.render())
 
     def selectNewAttacker(self) -> Player:
         self.attackOrder = (self.attackOrder + 1) % len(self.players)
@@ -406,11 +494,10 @@ class Room:
                 self.turn.playerDyingAttack(player, piece)
                 continue
 
-            player.dead = True
+            self.setPlayerDead(player)
+            self.server.invalidateLobby()
 
-            builder = XMLBuilder("DIE")
-            builder.player.name(player.name)
-            self.broadXml(builder)
+            self.broadXml(Templates.DIE.render(player.name))
 
             if self.getAliveCount() >= 2 and (piece := player.getOwnedPieceById(117)) is not None:  # DYING_ATTACK
                 self.turn.playerDyingAttack(player, piece)
@@ -423,14 +510,12 @@ class Room:
 
                 if player.team == "SINGLE":
                     player.lost = True
-                elif player.team not in self.getAliveTeams():
+                elif not self.isTeamAlive(player.team):
                     for _player in self.players:
                         if _player.team == player.team:
                             _player.lost = True
 
-                # Reuse builder to broadcast to lobby
-                builder.roomID(str(self.id))
-                self.server.lobbyBroadXml(builder)
+                self.server.lobbyBroadXml(Templates.LOBBY_DIE.render(player.name, str(self.id)), subject=player.name)
 
     def handlePlayersUnillusion(self):
         for player in self.players:
@@ -443,8 +528,9 @@ class Room:
                 player.unfog()
 
     def doPlayersDeals(self):
+        dealingPlayers: list[Player] = []
         for player in self.players:
-            print(player.name, "HP:", player.hp, "MP:", player.mp, "YEN:", player.yen, "PIECES:", len(player.pieces), "MAGICS:", len(player.magics), "DISEASE:", player.disease if player.disease else "None", "HARMS:", player.harms)
+            logger.debug("%s HP: %d MP: %d YEN: %d PIECES: %d MAGICS: %d DISEASE: %s HARMS: %s", player.name, player.hp, player.mp, player.yen, len(player.pieces), len(player.magics), player.disease if player.disease else "None", player.harms)
             if player.deal > 0 and not player.dead:
                 if player.session is not None or self.fdIncludeBots:
                     if self.inningCount == -1 and self.forceInitialDeal is not None:
@@ -455,24 +541,28 @@ class Room:
                         player.dealItem(self.forceNextDeal)
                         player.deal -= 1
                         self.forceNextDeal = None
-                items = self.server.itemManager.getProbRandomItems(player.deal)
-                for item in items:
-                    player.dealItem(item.id)
-                player.deal = 0
+                dealingPlayers.append(player)
+
+        # Draw the whole inning's deals in one go.
+        dealtItems = self.server.itemManager.getProbRandomItemsBatch(self.randGen, [max(0, player.deal) for player in dealingPlayers])
+        for player, items in zip(dealingPlayers, dealtItems):
+            for item in items:
+                player.dealItem(item.id)
+            player.deal = 0
 
     def beforeEndInning(self) -> bool:
         self.handlePlayersDeath()
         self.handlePlayersUnillusion()
         self.handlePlayersUnfog()
 
-        if not self.turn.attackQueue.empty():
+        if len(self.turn.attackQueue) > 0:
             return False
 
         if not self.handledDiseaseThisTurn:
             self.handledDiseaseThisTurn = True
             if not self.turn.attacker.dead and self.turn.attacker.disease:
                 gotWorse = False
-                if random.randrange(100) < self.turn.attacker.worseChance:
+                if self.rand.randrange(100) < self.turn.attacker.worseChance:
                     gotWorse = True
                     self.turn.attacker.addHarm(self.turn.attacker.disease)
                 else:
@@ -492,27 +582,19 @@ class Room:
             for player in self.players:
                 if player.dead or player.assistant is None or not player.isEnemy(self.turn.attacker):
                     continue
-                if random.randrange(100) < 30:
+                if self.rand.randrange(100) < 30:
                     player.assistant.onAttackOpportunity()
 
-            return self.turn.attackQueue.empty()
+            return len(self.turn.attackQueue) == 0
 
         return True
 
     def endInning(self):
-        while not self.beforeEndInning():
-            if not self.turn.doAttack():
-                # Player input is required to proceed.
-                return False
-
-        print("Round", self.inningCount+1, "ended, starting new round..")
+        logger.debug("Round %d ended, starting new round..", self.inningCount + 1)
 
         self.doPlayersDeals()
 
-        builder = XMLBuilder("END_INNING")
-        self.broadXml(builder)
-
-        return True
+        self.broadXml(Templates.END_INNING.render())
 
     def startInning(self):
         self.turn.new(self.selectNewAttacker())
@@ -522,15 +604,24 @@ class Room:
         self.handledDiseaseThisTurn = False
         self.handledAssistantThisTurn = False
 
-        builder = XMLBuilder("START_INNING")
-        builder.attacker.name(self.turn.attacker.name)
-        self.broadXml(builder)
+        self.broadXml(Templates.START_INNING.render(self.turn.attacker.name))
 
     def nextInning(self):
+        if self.isAdvancing():
+            return
+        self.inningSteps = self.advanceInnings()
+        self.runInningSteps()
+
+    def advanceInnings(self) -> Iterator[None]:
+        """Plays the game until player input is required, pausing after every attack and bot command."""
         while True:
-            if not self.endInning():
-                # Player input is required to proceed.
-                break
+            while not self.beforeEndInning():
+                if not self.turn.doAttack():
+                    # Player input is required to proceed.
+                    return
+                yield
+
+            self.endInning()
 
             if self.checkEndGame():
                 self.endGame()
@@ -538,11 +629,36 @@ class Room:
 
             self.startInning()
 
-            if self.turn.attacker.aiProcessor is not None:
-                self.turn.attackerCommand(self.turn.attacker, *self.turn.attacker.aiProcessor.onAttackTurn())
-                continue
+            if self.turn.attacker.aiProcessor is None:
+                # Player input is required to proceed.
+                return
 
-            # Player input is required to proceed.
-            break
+            self.turn.attackerCommand(self.turn.attacker, *self.turn.attacker.aiProcessor.onAttackTurn())
+            yield
+
+    def runInningSteps(self):
+        # Without a slice budget the game advances in one go, else the reactor gets back control
+        # once the slice is spent, so other rooms and the lobby aren't kept waiting.
+        self.resumeCall = None
+        budget = self.server.inningSliceBudget
+        deadline = time.perf_counter() + budget if budget is not None else None
+        try:
+            for _ in self.inningSteps or ():
+                if deadline is not None and time.perf_counter() >= deadline:
+                    self.resumeCall = reactor.callLater(0, self.runInningSteps)
+                    return
+        finally:
+            # Also when a step raised, else the room would look advancing forever and ignore its players.
+            if self.resumeCall is None:
+                self.inningSteps = None
+
+    def isAdvancing(self) -> bool:
+        return self.inningSteps is not None
+
+    def stopAdvancing(self):
+        if self.resumeCall is not None:
+            self.resumeCall.cancel()
+            self.resumeCall = None
+        self.inningSteps = None
 
 
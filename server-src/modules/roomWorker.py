@@ -0,0 +1,213 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Callable, Optional
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from modules.room import Room
+from server import Server
+from modules.session import Session
+from modules.encodedXml import EncodedXml
+from modules.logs import setupLogging
+
+from twisted.internet import reactor
+import logging
+import threading
+
+__all__ = ("WorkerServer", "runWorker", "startReader",)
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerUser:
+    """Stands in a room worker for a connection that lives in the front process."""
+    server: WorkerServer
+    userName: str
+    ipAddress: str
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, server: WorkerServer, userName: str, ipAddress: str):
+        self.server = server
+        self.userName = userName
+        self.ipAddress = ipAddress
+
+    def sendXml(self, xml):
+        self.sendEncodedXml(EncodedXml.fromXml(xml))
+
+    def sendEncodedXml(self, encoded: EncodedXml):
+        self.server.queueSend(self.userName, encoded)
+
+class WorkerSession(Session):
+    __slots__ = ()
+
+    def gotoLobby(self):
+        # The lobby lives in the front process.
+        self.state = "LOBBY"
+        self.server.dropSession(self.userName)
+        self.server.queueMessage(("lobby_user", self.userName))
+
+class WorkerServer(Server):
+    """
+    Runs the rooms a front process assigned to this worker.
+
+    Messages for the front are queued and sent in one batch at the end of the reactor turn, a
+    broadcast is sent once with the names of its recipients.
+    """
+    connection: Connection
+    sessions: dict[str, WorkerSession]
+    outbox: list[Any]
+    flushScheduled: bool
+    assignedRoomId: Optional[int]
+    roomSummaries: dict[int, tuple]
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, connection: Connection, mode: str, language: str, serverNumber: int):
+        Server.__init__(self, mode, language, serverNumber)
+        self.connection = connection
+        self.sessions = dict()
+        self.outbox = list()
+        self.flushScheduled = False
+        self.assignedRoomId = None
+        self.roomSummaries = dict()
+
+    def addUser(self, user: Session):
+        pass
+
+    def removeUser(self, user: Session):
+        pass
+
+    def lobbyBroadXml(self, xml, key: Optional[tuple] = None, cancels: Optional[tuple] = None, subject: Optional[str] = None):
+        self.queueMessage(("lobby", EncodedXml.fromXml(xml).data))
+
+    def createRoom(self, name: str, password: str = "", serverMode: str = "") -> Room:
+        # Room ids are handed out by the front process, so they're unique among every worker.
+        assert self.assignedRoomId is not None
+        self.lastRoomId = self.assignedRoomId - 1
+        self.assignedRoomId = None
+        return Server.createRoom(self, name, password, serverMode)
+
+    def createSession(self, info: dict, serverMode: str) -> WorkerSession:
+        user = WorkerUser(self, info["name"], info["ipAddress"])
+        session = WorkerSession(user, info)
+        session.serverMode = serverMode
+        session.state = "LOBBY"
+        self.sessions[session.userName] = session
+        return session
+
+    def dropSession(self, userName: str):
+        self.sessions.pop(userName, None)
+
+    def queueMessage(self, message: tuple):
+        self.outbox.append(message)
+        self.scheduleFlush()
+
+    def scheduleFlush(self):
+        if not self.flushScheduled:
+            self.flushScheduled = True
+            reactor.callLater(0, self.flush)
+
+    def queueSend(self, userName: str, encoded: EncodedXml):
+        if len(self.outbox) > 0:
+            last = self.outbox[-1]
+            if last[0] == "send" and last[2] is encoded:
+                last[1].append(userName)
+                return
+        self.queueMessage(["send", [userName], encoded])
+
+    def flush(self):
+        self.flushScheduled = False
+
+        # Room changes go first, so the front knows a room before its users are told they entered it.
+        messages: list[tuple] = list()
+        for id, room in self.rooms.items():
+            summary = WorkerServer.summarizeRoom(room)
+            if self.roomSummaries.get(id) != summary:
+                self.roomSummaries[id] = summary
+                messages.append(("room", id, summary))
+        for id in [id for id in self.roomSummaries if id not in self.rooms]:
+            del self.roomSummaries[id]
+            messages.append(("room", id, None))
+
+        for message in self.outbox:
+            messages.append(("send", message[1], message[2].data) if message[0] == "send" else message)
+        self.outbox.clear()
+
+        if len(messages) > 0:
+            self.connection.send(messages)
+
+    @staticmethod
+    def summarizeRoom(room: Room) -> tuple:
+        # Everything the front needs to list the room in the lobby and to find players to reconnect.
+        players = tuple((player.name, player.team, player.dead) for player in room.players)
+        return (room.name, room.password, room.language, room.playersLimit, room.time, room.playing, players)
+
+    def onFrontMessage(self, message: tuple):
+        kind = message[0]
+        if kind == "request":
+            _, userName, request, xmldict = message
+            session = self.sessions.get(userName)
+            if session is not None:
+                session.onRequest(request, xmldict)
+
+        elif kind == "enter":
+            _, roomId, info, serverMode, xmldict = message
+            session = self.createSession(info, serverMode)
+            self.assignedRoomId = roomId
+            session.onRequest("ENTER", xmldict)
+            self.assignedRoomId = None
+            self.queueEntered(session)
+
+        elif kind == "login":
+            _, roomId, info, serverMode = message
+            session = self.createSession(info, serverMode)
+            if serverMode == "TRAINING":
+                self.assignedRoomId = roomId
+                session.onTrainingLogin()
+                self.assignedRoomId = None
+            else:
+                session.onFreeFightLogin()
+            if session.room is not None:
+                self.queueEntered(session)
+
+        elif kind == "leave":
+            _, userName = message
+            session = self.sessions.pop(userName, None)
+            if session is not None:
+                session.onDisconnect()
+            self.queueMessage(("left", userName))
+
+        else:
+            logger.error("Unknown message from the front process: %r", kind)
+
+        # Send the room changes even if nothing was sent to the users.
+        self.scheduleFlush()
+
+    def queueEntered(self, session: WorkerSession):
+        if session.room is None:
+            self.dropSession(session.userName)
+        self.queueMessage(("entered", session.userName, session.room.id if session.room is not None else None))
+
+def startReader(connection: Connection, name: str, onMessage: Callable[[Any], None], onClosed: Callable[[], None]):
+    """Receives from one end of a worker pipe in its own thread, both ends use it."""
+    def read():
+        # Every message is handled in the reactor thread.
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                reactor.callFromThread(onClosed)
+                return
+            reactor.callFromThread(onMessage, message)
+
+    threading.Thread(target=read, name=name, daemon=True).start()
+
+def runWorker(connection: Connection, mode: str, language: str, serverNumber: int, inningSliceBudget: Optional[float], logLevel: str):
+    """Entry point of a room worker process."""
+    setupLogging(logLevel)
+
+    server = WorkerServer(connection, mode, language, serverNumber)
+    server.inningSliceBudget = inningSliceBudget
+    startReader(connection, "RoomWorkerReader", server.onFrontMessage, reactor.stop)
+
+    logger.info("Room worker ready")
+    reactor.run()
@@ -0,0 +1,297 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from multiprocessing.process import BaseProcess
+    from server import Server
+    from modules.user import User
+from modules.session import Session
+from modules.encodedXml import EncodedXml
+
+from twisted.internet import reactor
+import functools
+import logging
+import multiprocessing
+
+__all__ = ("RemotePlayer", "RemoteRoom", "FrontSession", "RoomWorkerPool",)
+
+logger = logging.getLogger(__name__)
+
+
+class RemotePlayer:
+    name: str
+    team: str
+    dead: bool
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, name: str, team: str, dead: bool):
+        self.name = name
+        self.team = team
+        self.dead = dead
+
+class RemoteRoom:
+    """What the front process knows about a room that runs in a worker, enough to list it in the lobby."""
+    id: int
+    worker: int
+    name: str
+    password: str
+    language: str
+    playersLimit: int
+    time: int
+    playing: bool
+    players: list[RemotePlayer]
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, id: int, worker: int):
+        self.id = id
+        self.worker = worker
+        self.name = str()
+        self.password = str()
+        self.language = str()
+        self.playersLimit = int()
+        self.time = int()
+        self.playing = bool()
+        self.players = list()
+
+    def update(self, summary: tuple):
+        self.name, self.password, self.language, self.playersLimit, self.time, self.playing, players = summary
+        self.players = [RemotePlayer(*player) for player in players]
+
+    def getPlayer(self, name: str) -> Optional[RemotePlayer]:
+        for player in self.players:
+            if player.name == name:
+                return player
+        return None
+
+    def stopAdvancing(self):
+        # The game is played in the worker, which stops it when it removes the room.
+        pass
+
+class FrontSession(Session):
+    """A session whose room requests are handled by a room worker process."""
+    worker: Optional[int]
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, user: User, xmldict: dict):
+        Session.__init__(self, user, xmldict)
+        self.worker = None
+
+    @property
+    def pool(self) -> RoomWorkerPool:
+        assert self.server.roomWorkers is not None
+        return self.server.roomWorkers
+
+    def onDisconnect(self):
+        if self.worker is None:
+            Session.onDisconnect(self)
+            return
+        # The user stays listed until its worker is done removing it from the room.
+        self.state = "DISCONNECTED"
+        self.pool.sendToWorker(self.worker, ("leave", self.userName))
+
+    def onTrainingLogin(self):
+        self.pool.assignLogin(self, self.pool.pickWorker(), self.pool.allocateRoomId())
+
+    def onFreeFightLogin(self):
+        room = self.server.getPlayerRoom(self.userName)
+        if room is not None:
+            self.pool.assignLogin(self, room.worker, None)
+            return
+        self.gotoLobby()
+
+    def onRequest(self, request, xmldict):
+        if self.worker is not None:
+            if self.room is not None:
+                self.pool.sendToWorker(self.worker, ("request", self.userName, request, xmldict))
+            # Else the worker didn't answer the ENTER yet.
+            return
+
+        if request != "ENTER":
+            return
+
+        roomId = None
+        if xmldict.get("name") is not None:
+            roomId = self.pool.allocateRoomId()
+            worker = self.pool.pickWorker()
+        elif xmldict.get("id") is not None:
+            room = self.server.getRoom(int(xmldict["id"]))
+            if room is None:
+                return
+            worker = room.worker
+        else:
+            return
+
+        self.pool.assignEnter(self, worker, roomId, xmldict)
+
+class RoomWorkerPool:
+    """
+    Runs the rooms in worker processes, the front process keeps the connections and the lobby.
+
+    Every room lives in one worker for its whole life. The room requests of its users are forwarded
+    to that worker, which sends back what to send to whom and a summary of its rooms for the lobby.
+    """
+    server: Server
+    count: int
+    logLevel: str
+    processes: list[BaseProcess]
+    connections: list[Connection]
+    sessions: dict[str, FrontSession]
+    stopping: bool
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, server: Server, count: int, logLevel: str):
+        assert count > 0
+        self.server = server
+        self.count = count
+        self.logLevel = logLevel
+        self.processes = list()
+        self.connections = list()
+        self.sessions = dict()
+        self.stopping = False
+
+    def start(self):
+        # Imported here, the worker module needs the Server class.
+        from modules.roomWorker import runWorker, startReader
+
+        context = multiprocessing.get_context("spawn")
+        for idx in range(self.count):
+            connection, workerConnection = context.Pipe()
+            process = context.Process(target=runWorker, name=f"RoomWorker-{idx}", daemon=True,
+                                      args=(workerConnection, self.server.mode, self.server.language, self.server.serverNumber, self.server.inningSliceBudget, self.logLevel))
+            process.start()
+            workerConnection.close()
+
+            self.processes.append(process)
+            self.connections.append(connection)
+            startReader(connection, f"RoomWorkerReader-{idx}", functools.partial(self.onWorkerMessages, idx), functools.partial(self.onWorkerLost, idx))
+
+        reactor.addSystemEventTrigger("before", "shutdown", self.stop)
+        logger.info("Started %d room workers", self.count)
+
+    def stop(self):
+        self.stopping = True
+        for connection in self.connections:
+            connection.close()
+        for process in self.processes:
+            process.join(5)
+
+    def pickWorker(self) -> int:
+        roomCounts = [0] * self.count
+        for room in self.server.rooms.values():
+            roomCounts[room.worker] += 1
+        return roomCounts.index(min(roomCounts))
+
+    def allocateRoomId(self) -> int:
+        self.server.lastRoomId += 1
+        return self.server.lastRoomId
+
+    def sendToWorker(self, worker: int, message: tuple):
+        if self.stopping:
+            return
+        self.connections[worker].send(message)
+
+    @staticmethod
+    def getSessionInfo(session: Session) -> dict:
+        return {
+            "name": session.userName,
+            "ipAddress": session.user.ipAddress,
+            "language": session.language,
+            "oneTimeID": session.oneTimeID,
+        }
+
+    def assignSession(self, session: FrontSession, worker: int):
+        # Kept out of the lobby until the worker answers.
+        session.worker = worker
+        session.state = "ENTERING"
+        self.sessions[session.userName] = session
+
+    def assignLogin(self, session: FrontSession, worker: int, roomId: Optional[int]):
+        self.assignSession(session, worker)
+        self.sendToWorker(worker, ("login", roomId, RoomWorkerPool.getSessionInfo(session), session.serverMode))
+
+    def assignEnter(self, session: FrontSession, worker: int, roomId: Optional[int], xmldict: dict):
+        self.assignSession(session, worker)
+        self.sendToWorker(worker, ("enter", roomId, RoomWorkerPool.getSessionInfo(session), session.serverMode, xmldict))
+
+    def releaseSession(self, session: FrontSession):
+        session.worker = None
+        session.room = None
+        del self.sessions[session.userName]
+        self.server.invalidateLobby()
+
+    def onWorkerMessages(self, worker: int, messages: list[tuple]):
+        for message in messages:
+            kind = message[0]
+            if kind == "send":
+                _, userNames, data = message
+                encoded = EncodedXml(data)
+                for userName in userNames:
+                    session = self.sessions.get(userName)
+                    if session is not None and session.state != "DISCONNECTED":
+                        session.sendEncodedXml(encoded)
+
+            elif kind == "lobby":
+                self.server.lobbyBroadXml(EncodedXml(message[1]))
+
+            elif kind == "room":
+                _, roomId, summary = message
+                room = self.server.rooms.get(roomId)
+                if summary is None:
+                    if room is not None:
+                        self.server.removeRoom(room)
+                else:
+                    if room is None:
+                        room = self.server.rooms[roomId] = RemoteRoom(roomId, worker)
+                    for player in room.players:
+                        self.server.unindexPlayer(player.name, room)
+                    room.update(summary)
+                    for player in room.players:
+                        self.server.indexPlayer(player.name, room)
+                    self.server.invalidateLobby()
+
+            elif kind == "entered":
+                _, userName, roomId = message
+                session = self.sessions[userName]
+                if session.state == "DISCONNECTED":
+                    continue
+                if roomId is None:
+                    self.releaseSession(session)
+                    session.state = "LOBBY"
+                else:
+                    session.room = self.server.rooms[roomId]
+                    self.server.invalidateLobby()
+                    session.state = "ROOM"
+
+            elif kind == "lobby_user":
+                session = self.sessions[message[1]]
+                if session.state == "DISCONNECTED":
+                    continue
+                self.releaseSession(session)
+                session.gotoLobby()
+
+            elif kind == "left":
+                session = self.sessions[message[1]]
+                self.releaseSession(session)
+                self.server.removeUser(session)
+
+            else:
+                logger.error("Unknown message from room worker %d: %r", worker, kind)
+
+    def onWorkerLost(self, worker: int):
+        if self.stopping:
+            return
+        logger.error("Room worker %d stopped, dropping its rooms.", worker)
+
+        for room in [room for room in self.server.rooms.values() if room.worker == worker]:
+            self.server.removeRoom(room)
+        for session in [session for session in self.sessions.values() if session.worker == worker]:
+            self.releaseSession(session)
+            if session.state == "DISCONNECTED":
+                # Gone already, it was only waiting for the worker's "left".
+                self.server.removeUser(session)
+            else:
+                session.user.transport.loseConnection()
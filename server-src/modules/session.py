@@ -6,6 +6,8 @@ if TYPE_CHECKING:
     from modules.room import Room
 from modules.player import Player
 from modules.commandPiece import CommandPiece
+from modules.encodedXml import EncodedXml
+from modules.logs import setLogLevel
 from helpers.xmlbuilder import XMLBuilder
 
 import random
@@ -50,6 +52,9 @@ class Session:
     def sendXml(self, xml):
         self.user.sendXml(xml)
 
+    def sendEncodedXml(self, encoded: EncodedXml):
+        self.user.sendEncodedXml(encoded)
+
     def onDisconnect(self):
         if self.room is not None:
             if self.player is not None:
@@ -78,34 +83,36 @@ class Session:
 
         self.player = Player(self.room, self, "SINGLE")
         self.player.ready = True
-        self.room.players.append(self.player)
+        self.room.addPlayer(self.player)
 
         botNames = ["Princess Kaguya", "Sinbad", "Odin", "Santa Claus", "Robin Hood"]
         for name in random.sample(botNames, 3):
             player = Player(self.room, name, "SINGLE")
             player.ready = True
             player.enableAIProcessor()
-            self.room.players.append(player)
+            self.room.addPlayer(player)
 
         self.room.addUser(self)
         self.room.startGame()
 
     def onFreeFightLogin(self):
-        for room in self.server.rooms.values():
+        room = self.server.getPlayerRoom(self.userName)
+        if room is not None:
             privPlayer = room.getPlayer(self.userName)
-            if room.playing and privPlayer is not None:
-                self.player = privPlayer
-                self.player.session = self
-                self.player.disableAIProcessor()
-                self.room = room
-                self.room.addUser(self)
-                break
+            assert privPlayer is not None
+            self.player = privPlayer
+            self.player.session = self
+            self.player.disableAIProcessor()
+            self.room = room
+            self.room.addUser(self)
         if self.room is None:
             self.gotoLobby()
 
     def gotoLobby(self):
-        self.sendXml(self.server.buildLobbyXml())
+        self.sendEncodedXml(self.server.getLobbySnapshot())
         self.state = "LOBBY"
+        if self.server.lobbyBroadcaster is not None:
+            self.server.lobbyBroadcaster.addEntrant(self)
 
     def onRequest(self, request, xmldict):
         if request != "ENTER" and self.room is None:
@@ -177,15 +184,20 @@ class Session:
 
             longestMatchSession = None
             maxInningCount = -1
-            for _ in range(count):
-                newSession = FakeSession()
-                self.room.users[0] = newSession
-                self.room.startGame()
-                if longestMatchSession is None or self.room.inningCount > maxInningCount:
-                    longestMatchSession = newSession
-                    maxInningCount = self.room.inningCount
-
-            self.room.users[0] = self
+            # Each game has to be over when startGame returns, so it's played without slices.
+            sliceBudget = self.server.inningSliceBudget
+            self.server.inningSliceBudget = None
+            try:
+                for _ in range(count):
+                    newSession = FakeSession()
+                    self.room.users[0] = newSession
+                    self.room.startGame()
+                    if longestMatchSession is None or self.room.inningCount > maxInningCount:
+                        longestMatchSession = newSession
+                        maxInningCount = self.room.inningCount
+            finally:
+                self.server.inningSliceBudget = sliceBudget
+                self.room.users[0] = self
             if longestMatchSession is not None:
                 for xml in longestMatchSession.xmlList:
                     self.sendXml(xml)
@@ -219,6 +231,9 @@ class Session:
         elif comment.startswith("fna") and len(args) > 0:
             self.room.forceNextAssistant = args[0]
 
+        elif comment.startswith("fsd") and len(args) > 0:
+            self.room.forceSeed = int(args[0])
+
         elif comment.startswith("newbot") and not self.room.playing:
             count = int(args[0]) if len(args) > 0 else 1
             team = args[1].upper() if len(args) > 1 else "SINGLE"
@@ -228,7 +243,7 @@ class Session:
                 player = Player(self.room, ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(12)), team)
                 player.ready = True
                 player.enableAIProcessor()
-                self.room.players.append(player)
+                self.room.addPlayer(player)
 
                 # TODO: Move this to room class
                 builder = XMLBuilder("ADD_PLAYER")
@@ -246,7 +261,11 @@ class Session:
 
                 # Broadcast to Lobby
                 builder.roomID(str(self.room.id))
-                self.server.lobbyBroadXml(builder)
+                self.server.lobbyBroadXml(builder, subject=player.name)
+
+        elif comment.startswith("loglevel") and len(args) > 1:
+            # e.g. "loglevel protocol DEBUG" turns message tracing on.
+            setLogLevel(args[0], args[1])
 
         elif comment.startswith("clp"):
             for player in self.room.players:
@@ -290,6 +309,10 @@ class Session:
         assert self.room is not None
         assert self.player is not None
 
+        if self.room.isAdvancing():
+            # The game is still playing the bots' turns, this can't be an answer to it.
+            return
+
         response = "doBuy" in xmldict
         self.room.turn.playerBuyResponse(self.player, response)
 
@@ -300,6 +323,10 @@ class Session:
         assert self.room is not None
         assert self.player is not None
 
+        if self.room.isAdvancing():
+            # The game is still playing the bots' turns, this can't be an answer to it.
+            return
+
         piece = xmldict.get("piece", [])
         target = xmldict.get("@target")
         power = xmldict.get("power", None)
@@ -347,4 +374,7 @@ class FakeSession(Session):
         self.xmlList = list()
 
     def sendXml(self, xml):
-        self.xmlList.append(str(xml))
\ No newline at end of file
+        self.xmlList.append(str(xml))
+
+    def sendEncodedXml(self, encoded: EncodedXml):
+        self.xmlList.append(encoded.xml)
\ No newline at end of file
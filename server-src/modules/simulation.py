@@ -0,0 +1,104 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+if TYPE_CHECKING:
+    from server import Server
+from modules.room import Room
+from modules.player import Player
+
+import random
+import time
+import traceback
+
+__all__ = ("MatchResult", "Simulator",)
+
+
+class MatchResult:
+    seed: int
+    innings: int
+    winner: str
+    elapsed: float
+    # (name, hp, mp, yen) of every player at the end of the game, in seat order.
+    players: tuple[tuple[str, int, int, int], ...]
+    # The traceback of the exception that stopped the game, if it failed.
+    error: Optional[str]
+
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, seed: int, innings: int, winner: str, elapsed: float, players: tuple[tuple[str, int, int, int], ...], error: Optional[str] = None):
+        self.seed = seed
+        self.innings = innings
+        self.winner = winner
+        self.elapsed = elapsed
+        self.players = players
+        self.error = error
+
+    def __reduce__(self):
+        # Sent back by the simulation workers, keep the pickle small.
+        return (MatchResult, (self.seed, self.innings, self.winner, self.elapsed, self.players, self.error))
+
+class Simulator:
+    """
+    Plays bot-only games in a room without users, so nothing is serialized or sent.
+
+    The room is reused from game to game, like the "test_go" chat command does. Game seeds are drawn
+    from `seedSource`, so a run is reproducible and any of its games can be replayed alone.
+    """
+    server: Server
+    room: Room
+    seedSource: random.Random
+
+    DRAW = "DRAW"
+    FAILED = "FAILED"
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, server: Server, botCount: int, teamCount: int = 0):
+        assert botCount >= 2, "A game needs at least 2 players."
+        assert 0 <= teamCount <= len(Room.VALID_TEAMS), "Invalid team count."
+
+        self.server = server
+        self.room = server.createRoom("Simulation")
+        self.room.playersLimit = botCount
+        self.room.teamPlay = teamCount > 0
+        self.seedSource = random.Random()
+
+        for idx in range(botCount):
+            team = Room.VALID_TEAMS[idx % teamCount] if teamCount > 0 else "SINGLE"
+            player = Player(self.room, f"Bot{idx + 1}", team)
+            player.ready = True
+            player.enableAIProcessor()
+            self.room.addPlayer(player)
+
+    def reseed(self, seed: int):
+        self.seedSource.seed(seed)
+
+    def runGame(self, seed: Optional[int] = None) -> MatchResult:
+        # Room.endGame leaves the room flagged as playing.
+        self.room.playing = False
+        self.room.forceSeed = seed if seed is not None else self.seedSource.getrandbits(63)
+
+        start = time.perf_counter()
+        error = None
+        try:
+            self.room.startGame()
+            assert self.room.ended, "Simulated game stopped waiting for player input."
+        except Exception:
+            # Recorded with its seed so the run goes on and the game can be replayed alone.
+            error = traceback.format_exc()
+            self.room.stopAdvancing()
+        elapsed = time.perf_counter() - start
+
+        players = tuple((player.name, player.hp, player.mp, player.yen) for player in self.room.players)
+        winner = self.getWinner() if error is None else Simulator.FAILED
+        return MatchResult(self.room.seed, self.room.inningCount + 1, winner, elapsed, players, error)
+
+    def runGames(self, count: int) -> list[MatchResult]:
+        return [self.runGame() for _ in range(count)]
+
+    def getWinner(self) -> str:
+        winners = [player for player in self.room.players if not player.lost]
+        if len(winners) == 0:
+            return Simulator.DRAW
+        return winners[0].team if self.room.teamPlay else winners[0].name
+
+    def close(self):
+        self.server.removeRoom(self.room)
@@ -0,0 +1,45 @@
+from __future__ import annotations
+from typing import Optional
+from modules.encodedXml import EncodedXml
+
+from xml.sax.saxutils import escape
+
+__all__ = ("XmlTemplate", "Templates",)
+
+
+class XmlTemplate:
+    """A fixed-shape message kept as pre-encoded fragments, with "{}" slots for (escaped) text values."""
+    fragments: list[bytes]
+    static: Optional[EncodedXml]
+
+    HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, xml: str):
+        self.fragments = [fragment.encode() for fragment in (XmlTemplate.HEADER + xml + chr(0)).split("{}")]
+        # Messages without slots are the same every time, so they are only encoded once.
+        self.static = EncodedXml(self.fragments[0]) if len(self.fragments) == 1 else None
+
+    def render(self, *values: str) -> EncodedXml:
+        if self.static is not None:
+            return self.static
+        assert len(values) == len(self.fragments) - 1, f"Template expects {len(self.fragments) - 1} values, got {len(values)}!"
+        parts = [self.fragments[0]]
+        for value, fragment in zip(values, self.fragments[1:]):
+            parts.append(escape(value).encode())
+            parts.append(fragment)
+        return EncodedXml(b"".join(parts))
+
+
+class Templates:
+    DEAL = XmlTemplate("<DEAL><item>{}</item></DEAL>")
+    START_INNING = XmlTemplate("<START_INNING><attacker><name>{}</name></attacker></START_INNING>")
+    END_INNING = XmlTemplate("<END_INNING />")
+    RESET_ATTACK_ORDER = XmlTemplate("<RESET_ATTACK_ORDER />")
+    DIE = XmlTemplate("<DIE><player><name>{}</name></player></DIE>")
+    LOBBY_DIE = XmlTemplate("<DIE><player><name>{}</name></player><roomID>{}</roomID></DIE>")
+    ADD_USER = XmlTemplate("<ADD_USER><user><name>{}</name></user></ADD_USER>")
+    LOBBY_ADD_USER = XmlTemplate("<ADD_USER><user><name>{}</name></user><roomID>{}</roomID></ADD_USER>")
+    REMOVE_USER = XmlTemplate("<REMOVE_USER><user><name>{}</name></user></REMOVE_USER>")
+    ROOM_REMOVE_USER = XmlTemplate("<REMOVE_USER><name>{}</name></REMOVE_USER>")
+    LOBBY_REMOVE_USER = XmlTemplate("<REMOVE_USER><roomID>{}</roomID><user><name>{}</name></user></REMOVE_USER>")
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Any, Callable, Optional
 if TYPE_CHECKING:
     from server import Server
     from modules.room import Room
@@ -10,17 +10,96 @@ from modules.commandPiece import CommandPiece
 from modules.attackData import AttackData
 from modules.assistant import Assistant
 
-import random
-from queue import Queue
+import logging
+import time
+from collections import deque
+
+__all__ = ("TurnHandler", "enableHandlerTimings", "disableHandlerTimings", "getHandlerTimings",)
+
+logger = logging.getLogger(__name__)
+
+
+# The TurnHandler methods handling each attackKind, attackExtra or mystery, filled by @handler.
+queueActionHandlers: dict[str, Callable[..., Any]] = dict()
+queueKindHandlers: dict[str, Callable[..., Any]] = dict()
+queueExtraHandlers: dict[str, Callable[..., Any]] = dict()
+mysteryHandlers: dict[str, Callable[..., Any]] = dict()
+inflictChainHandlers: dict[str, Callable[..., Any]] = dict()
+inflictEffectHandlers: dict[str, Callable[..., Any]] = dict()
+HANDLER_TABLES: dict[str, dict[str, Callable[..., Any]]] = {
+    "queueAction": queueActionHandlers,
+    "queueKind": queueKindHandlers,
+    "queueExtra": queueExtraHandlers,
+    "mystery": mysteryHandlers,
+    "inflictChain": inflictChainHandlers,
+    "inflictEffect": inflictEffectHandlers,
+}
+
+def handler(table: dict[str, Callable[..., Any]], *keys: str):
+    def wrapper(func):
+        for key in keys:
+            table[key] = func
+        return func
+    return wrapper
+
+# Calls and seconds spent in each handler, only counted after enableHandlerTimings.
+handlerTimings: Optional[dict[str, list]] = None
+
+def enableHandlerTimings():
+    """Wraps every handler to time it, the handlers aren't timed otherwise so the games don't pay for it."""
+    global handlerTimings
+    if handlerTimings is not None:
+        return
+    handlerTimings = dict()
+    for tableName, table in HANDLER_TABLES.items():
+        for key, func in table.items():
+            table[key] = timeHandler(handlerTimings.setdefault(f"{tableName}:{key}", [0, 0.0]), func)
+
+def timeHandler(counter: list, func: Callable[..., Any]) -> Callable[..., Any]:
+    def timed(*args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            counter[0] += 1
+            counter[1] += time.perf_counter() - start
+    timed.__wrapped__ = func
+    return timed
+
+def disableHandlerTimings():
+    global handlerTimings
+    if handlerTimings is None:
+        return
+    handlerTimings = None
+    for table in HANDLER_TABLES.values():
+        for key, func in table.items():
+            table[key] = func.__wrapped__
+
+def getHandlerTimings() -> dict[str, tuple[int, float]]:
+    """(calls, seconds) of every handler called since the timings were enabled."""
+    if handlerTimings is None:
+        return dict()
+    return dict((name, (calls, seconds)) for name, (calls, seconds) in handlerTimings.items() if calls > 0)
+
+class QueueState:
+    """What TurnHandler.queueAttack keeps while it goes through the pieces of an attack."""
+    atkData: AttackData
+    massiveAttack: bool
+    magicalPiece: Optional[CommandPiece]
 
-__all__ = ("TurnHandler",)
+    __slots__ = tuple(__annotations__)
+
+    def __init__(self, atkData: AttackData):
+        self.atkData = atkData
+        self.massiveAttack = False
+        self.magicalPiece = None
 
 
 class TurnHandler:
     room: Room
     server: Server
     currentAttack: Optional[AttackData]
-    attackQueue: Queue[AttackData]
+    attackQueue: deque[AttackData]
     attacker: Player
 
     __slots__ = tuple(__annotations__)
@@ -28,11 +107,12 @@ class TurnHandler:
     def __init__(self, room: Room):
         self.room = room
         self.server = room.server
+        self.attackQueue = deque()
         self.new()
 
     def new(self, attacker: Optional[Player] = None):
         self.currentAttack = None
-        self.attackQueue = Queue()
+        self.attackQueue.clear()
         self.attacker = attacker # type: ignore
 
     def playerDyingAttack(self, player: Player, piece: CommandPiece):
@@ -41,11 +121,11 @@ class TurnHandler:
         self.room.broadXml(builder)
 
         if piece.item.attackExtra == "REVIVE":
-            print("REVIVE")
+            logger.debug("REVIVE")
             player.discardPiece(piece)
             player.increaseHP(piece.item.value)
         else:
-            print("DYING ATTACK")
+            logger.debug("DYING ATTACK")
             newAttack = AttackData(player, player, [piece])
             piece.illusionItem = None
             newAttack.decidedValue = 30
@@ -62,7 +142,7 @@ class TurnHandler:
         decidedItem = atkData.decidedPiece.item
         assert atkData.defender.hasOwnedPiece(atkData.decidedPiece), f"\"{atkData.defender.name}\" doesn't have decided item \"{decidedItem.id}\""
 
-        print("Buy response: ", decidedItem, player, response)
+        logger.debug("Buy response: %s %s %s", decidedItem, player, response)
 
         builder = XMLBuilder("BUY")
 
@@ -82,11 +162,7 @@ class TurnHandler:
                 continue
             ownedPiece = player.getOwnedPiece(piece, pieceList)
             if ownedPiece is None:
-                print(idx)
-                print(pieceList)
-                print([str(id(p)) for p in pieceList])
-                print(player.pieces)
-                print([str(id(p)) for p in player.pieces])
+                logger.error("Piece %d of %s wasn't found in %s", idx, pieceList, player.pieces)
                 assert False, f"\"{player.name}\" tried to use a item he doesn't have!"
             pieceList[idx] = ownedPiece
 
@@ -96,12 +172,12 @@ class TurnHandler:
         assert forced or not atkData.attacker.dead, f"\"{atkData.attacker.name}\" is dead but tried to attack!"
         assert forced or not atkData.defender.dead, f"\"{atkData.defender.name}\" attacked but is dead!"
 
-        print(f"QueueAttack: pieceList={atkData.pieceList}")
+        logger.debug("QueueAttack: pieceList=%s", atkData.pieceList)
 
         if not forced and "FOG" in atkData.attacker.harms and atkData.attacker != atkData.defender:
             getRandomAlive = self.room.getRandomAliveEnemy if atkData.attacker.isEnemy(atkData.defender) else self.room.getRandomAliveAlly
             atkData.defender = getRandomAlive(atkData.attacker)
-            print(f"Attack target changed to: {atkData.defender}")
+            logger.debug("Attack target changed to: %s", atkData.defender)
 
         magicFreeIdxList: list[int] = []
         for idx, piece in enumerate(atkData.pieceList):
@@ -110,13 +186,12 @@ class TurnHandler:
                 magicFreeIdxList.append(idx - 1)
                 break
 
-        massiveAttack = False
+        state = QueueState(atkData)
         usedMagic = False
-        magicalPiece: Optional[CommandPiece] = None
 
         if not forced:
             self.convertPiecesToOwnedPieces(atkData.attacker, atkData.pieceList)
-            print(f"ownedPieceList={atkData.pieceList}")
+            logger.debug("ownedPieceList=%s", atkData.pieceList)
 
         for idx, piece in enumerate(atkData.pieceList):
             item = piece.item
@@ -125,15 +200,10 @@ class TurnHandler:
 
             isMagicFree = idx in magicFreeIdxList
 
-            if item.attackKind == "DO_NOTHING":
-                assert len(atkData.pieceList) == 1
-                assert not any(item.type == "WEAPON" for item in atkData.attacker.getItems())
-                atkData.isAction = True
-                atkData.attacker.deal += 1
-                break
-            elif item.attackKind == "DISCARD":
-                assert len(atkData.pieceList) > 1
-                atkData.isAction = True
+            # The actions don't use their pieces.
+            pieceHandler = queueActionHandlers.get(item.attackKind)
+            if pieceHandler is not None:
+                pieceHandler(self, state, piece, isMagicFree)
                 break
             elif not forced:
                 if piece.isAbility:
@@ -144,146 +214,24 @@ class TurnHandler:
 
             if item.type == "MAGIC":
                 usedMagic = True
-                if magicalPiece is not None and not isMagicFree:
-                    magicalPiece.costMP = atkData.attacker.mp
+                if state.magicalPiece is not None and not isMagicFree:
+                    state.magicalPiece.costMP = atkData.attacker.mp
                     atkData.damage = atkData.attacker.mp * 2
 
             if usedMagic and item.attackExtra == "MAGIC_FREE":
                 continue
 
-            if item.attackKind == "EXCHANGE":
-                assert len(atkData.pieceList) == 1
-                assert atkData.decidedExchange is not None
-                atkData.isAction = True
-
-                sum1 = atkData.decidedExchange["HP"] + atkData.decidedExchange["MP"] + atkData.decidedExchange["YEN"]
-                sum2 = atkData.attacker.hp + atkData.attacker.mp + atkData.attacker.yen
-                assert sum1 == sum2, str(atkData.decidedExchange)
-                break
-            elif item.attackKind == "SELL":
-                assert len(atkData.pieceList) == 2
-                if atkData.assistantType is None:
-                    atkData.attacker.discardPiece(atkData.pieceList[1])
-                atkData.decidedValue = atkData.pieceList[1].item.price
-                break
-            elif item.attackKind == "BUY":
-                assert len(atkData.pieceList) == 1
-                break
-            elif item.attackKind == "REMOVE_ITEMS":  # Sweep away 1 item
-                assert len(atkData.pieceList) == 1
-                break
-            elif item.attackKind == "REMOVE_ABILITIES": # Forget 1 miracle
-                assert len(atkData.pieceList) == 1
-                break
-
-            if item.attackKind == "MYSTERY":
-                assert len(atkData.pieceList) == 1
-                atkData.isAction = True
-                atkData.decidedMystery = random.choice(Assistant.VALID_TYPES)
-
-                if atkData.decidedMystery == "MARS":
-                    for player in self.room.players:
-                        player.disease = "FEVER"
-                elif atkData.decidedMystery == "MERCURY":
-                    for player in self.room.players:
-                        player.addHarm("FOG")
-                elif atkData.decidedMystery == "JUPITER":
-                    for player in self.room.players:
-                        player.addHarm("ILLUSION")
-                elif atkData.decidedMystery == "SATURN":
-                    for player in self.room.players:
-                        player.hp = 1
-                elif atkData.decidedMystery == "URANUS":
-                    atkData.isAction = False
-                    atkData.defender = self.room.getRandomAlive()
-                    atkData.damage = 60
-                    atkData.attribute = "LIGHT"
-                elif atkData.decidedMystery == "PLUTO":
-                    massiveAttack = True
-                    atkData.isAction = False
-                    atkData.chance = 75
-                    atkData.damage = 30
-                    atkData.attribute = "DARK"
-                elif atkData.decidedMystery == "NEPTUNE":
-                    atkData.attacker.increaseHP(60)
-                elif atkData.decidedMystery == "VENUS":
-                    for player in self.room.players:
-                        player.yen = 99
-                elif atkData.decidedMystery == "EARTH":
-                    everyoneItemCount: dict[Player, int] = {}
-                    everyoneItemList: list[Item] = []
-                    for player in self.room.players:
-                        everyoneItemCount[player] = len(player.pieces)
-                        everyoneItemList += list(player.getItems())
-                        player.pieces = list()
-                    for player, itemCount in everyoneItemCount.items():
-                        while len(player.pieces) < itemCount:
-                            itemIdx = random.randrange(0, len(everyoneItemList))
-                            player.pieces.append(CommandPiece(everyoneItemList[itemIdx]))
-                            del everyoneItemList[itemIdx]
-                elif atkData.decidedMystery == "MOON":
-                    for player in self.room.players:
-                        player.assistant = Assistant.createRandom(player)
-                break
-            elif item.attackKind == "SET_ASSISTANT":
-                assert len(atkData.pieceList) == 1 + (1 if isMagicFree else 0)
-                if self.room.forceNextAssistant is not None:
-                    atkData.decidedAssistant = self.room.forceNextAssistant
-                    self.room.forceNextAssistant = None
-                else:
-                    atkData.decidedAssistant = random.choice(Assistant.VALID_TYPES)
-                break
-            elif item.attackKind == "INCREASE_OR_DECREASE_HP":
-                assert len(atkData.pieceList) == 1
-                atkData.decidedHP = 10 if random.randrange(0, 2) == 1 else -10
-                break
-            elif item.attackKind == "ADD_ITEM":
-                assert len(atkData.pieceList) == 2
+            # These kinds are the whole attack, the pieces after them are only their arguments.
+            pieceHandler = queueKindHandlers.get(item.attackKind)
+            if pieceHandler is not None:
+                pieceHandler(self, state, piece, isMagicFree)
                 break
 
-            if item.attackExtra == "INCREASE_ATK":
-                if atkData.damage == -1:
-                    atkData.damage = 0
-                atkData.damage += item.getAtk()
-            elif item.attackExtra == "DOUBLE_ATK":
-                assert atkData.attribute is not None
-                assert atkData.damage >= 0 and len(atkData.pieceList) > 1, "Tried to use DOUBLE_ATK alone"
-                atkData.damage *= 2
-            elif item.attackExtra == "WIDE_ATK":
-                assert atkData.attribute is not None
-                assert atkData.damage >= 0 and len(atkData.pieceList) > 1, "Tried to use WIDE_ATK alone"
-                massiveAttack = True
-                atkData.chance = 100
-                atkData.attribute = ""
-            elif item.attackExtra == "MAGICAL":
-                if atkData.assistantType is None:
-                    magicalPiece = piece
-                    magicalPiece.costMP = atkData.attacker.mp
-                    atkData.damage = atkData.attacker.mp * 2
-                else:
-                    piece.costMP = 100
-                    atkData.damage = 200
+            pieceHandler = queueExtraHandlers.get(item.attackExtra)
+            if pieceHandler is not None:
+                pieceHandler(self, state, piece, isMagicFree)
+            elif item.attackExtra and item.attackExtra not in ["ADD_ATTRIBUTE"]:
                 atkData.extra.append(item.attackExtra)
-            elif item.attackExtra == "PESTLE":
-                assert len(atkData.pieceList) == 1
-                mortar = None
-                for player in self.room.players:
-                    if player.dead:
-                        continue
-                    mortarPiece = player.getOwnedPieceById(245)
-                    if mortarPiece is not None:
-                        mortar = (player, mortarPiece)
-                        break
-                if mortar is not None:
-                    atkData.mortar = mortar[1]
-                    atkData.damage = 999
-                    atkData.defender = mortar[0]
-                else:
-                    atkData.defender = self.room.getRandomAlive()
-                print("Mortar attack target selected.")
-            else:
-                if item.attackExtra and item.attackExtra not in ["ADD_ATTRIBUTE"]:
-                    atkData.extra.append(item.attackExtra)
 
             if item.attackKind == "ATK":
                 attack = item.getAtk()
@@ -292,10 +240,10 @@ class TurnHandler:
                     assert item.attackExtra == "DYING_ATTACK" or atkData.isCounter
                     attack = atkData.decidedValue
 
-                if item.hitRate > 0 and not massiveAttack:
-                    massiveAttack = True
+                if item.hitRate > 0 and not state.massiveAttack:
+                    state.massiveAttack = True
                     atkData.chance = item.hitRate
-                    print(f"Massive attack, chance: {atkData.chance}")
+                    logger.debug("Massive attack, chance: %d", atkData.chance)
 
                 if atkData.damage == -1:
                     atkData.damage = attack
@@ -305,12 +253,12 @@ class TurnHandler:
             elif atkData.attribute != item.attribute and item.attribute != "LIGHT":
                 atkData.attribute = ""
 
-        if magicalPiece is not None:
+        if state.magicalPiece is not None:
             atkData.attacker.mp = 0
 
-        if massiveAttack:
+        if state.massiveAttack:
             assert not atkData.isAction and atkData.chance > 0
-            print(f"New Massive Attack: {atkData}, {atkData.pieceList}")
+            logger.debug("New Massive Attack: %s, %s", atkData, atkData.pieceList)
             _atkData = None
             for player in self.room.players:
                 if player.dead:
@@ -319,36 +267,220 @@ class TurnHandler:
                     continue
                 _atkData = atkData.clone()
                 _atkData.defender = player
-                self.attackQueue.put(_atkData)
+                self.attackQueue.append(_atkData)
             if _atkData is None:
-                print("No alive enemy was found, massive attack wasn't executed.")
+                logger.debug("No alive enemy was found, massive attack wasn't executed.")
                 return
             _atkData.isLast = True
         else:
             if atkData.isAction:
                 if atkData.defender != atkData.attacker:
-                    print("Attack target changed to attacker due to it being an action.")
+                    logger.debug("Attack target changed to attacker due to it being an action.")
                 atkData.defender = atkData.attacker
             elif "TO_ENEMY" in atkData.extra and self.room.areEnemiesAlive(atkData.attacker):
-                print("Attack target changed to random enemy due to attackExtra.")
+                logger.debug("Attack target changed to random enemy due to attackExtra.")
                 atkData.defender = self.room.getRandomAliveEnemy(atkData.attacker)
-            print(f"New Attack: {atkData}, {atkData.pieceList}")
+            logger.debug("New Attack: %s, %s", atkData, atkData.pieceList)
             atkData.isLast = True
-            self.attackQueue.put(atkData)
+            self.attackQueue.append(atkData)
+
+    @handler(queueActionHandlers, "DO_NOTHING")
+    def queueDoNothing(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        assert len(atkData.pieceList) == 1
+        assert not any(item.type == "WEAPON" for item in atkData.attacker.getItems())
+        atkData.isAction = True
+        atkData.attacker.deal += 1
+
+    @handler(queueActionHandlers, "DISCARD")
+    def queueDiscard(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        assert len(state.atkData.pieceList) > 1
+        state.atkData.isAction = True
+
+    @handler(queueKindHandlers, "EXCHANGE")
+    def queueExchange(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        assert len(atkData.pieceList) == 1
+        assert atkData.decidedExchange is not None
+        atkData.isAction = True
+
+        sum1 = atkData.decidedExchange["HP"] + atkData.decidedExchange["MP"] + atkData.decidedExchange["YEN"]
+        sum2 = atkData.attacker.hp + atkData.attacker.mp + atkData.attacker.yen
+        assert sum1 == sum2, str(atkData.decidedExchange)
+
+    @handler(queueKindHandlers, "SELL")
+    def queueSell(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        assert len(atkData.pieceList) == 2
+        if atkData.assistantType is None:
+            atkData.attacker.discardPiece(atkData.pieceList[1])
+        atkData.decidedValue = atkData.pieceList[1].item.price
+
+    @handler(queueKindHandlers, "BUY", "REMOVE_ITEMS", "REMOVE_ABILITIES") # Sweep away 1 item, Forget 1 miracle
+    def queueSinglePiece(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        # Decided when the damage is inflicted.
+        assert len(state.atkData.pieceList) == 1
+
+    @handler(queueKindHandlers, "MYSTERY")
+    def queueMystery(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        assert len(atkData.pieceList) == 1
+        atkData.isAction = True
+        atkData.decidedMystery = self.room.rand.choice(Assistant.VALID_TYPES)
+        mysteryHandlers[atkData.decidedMystery](self, state)
+
+    @handler(mysteryHandlers, "MARS")
+    def mysteryMars(self, state: QueueState):
+        for player in self.room.players:
+            player.disease = "FEVER"
+
+    @handler(mysteryHandlers, "MERCURY")
+    def mysteryMercury(self, state: QueueState):
+        for player in self.room.players:
+            player.addHarm("FOG")
+
+    @handler(mysteryHandlers, "JUPITER")
+    def mysteryJupiter(self, state: QueueState):
+        for player in self.room.players:
+            player.addHarm("ILLUSION")
+
+    @handler(mysteryHandlers, "SATURN")
+    def mysterySaturn(self, state: QueueState):
+        for player in self.room.players:
+            player.hp = 1
+
+    @handler(mysteryHandlers, "URANUS")
+    def mysteryUranus(self, state: QueueState):
+        atkData = state.atkData
+        atkData.isAction = False
+        atkData.defender = self.room.getRandomAlive()
+        atkData.damage = 60
+        atkData.attribute = "LIGHT"
+
+    @handler(mysteryHandlers, "PLUTO")
+    def mysteryPluto(self, state: QueueState):
+        atkData = state.atkData
+        state.massiveAttack = True
+        atkData.isAction = False
+        atkData.chance = 75
+        atkData.damage = 30
+        atkData.attribute = "DARK"
+
+    @handler(mysteryHandlers, "NEPTUNE")
+    def mysteryNeptune(self, state: QueueState):
+        state.atkData.attacker.increaseHP(60)
+
+    @handler(mysteryHandlers, "VENUS")
+    def mysteryVenus(self, state: QueueState):
+        for player in self.room.players:
+            player.yen = 99
+
+    @handler(mysteryHandlers, "EARTH")
+    def mysteryEarth(self, state: QueueState):
+        everyoneItemCount: dict[Player, int] = {}
+        everyoneItemList: list[Item] = []
+        for player in self.room.players:
+            everyoneItemCount[player] = len(player.pieces)
+            everyoneItemList += list(player.getItems())
+            player.pieces = list()
+        for player, itemCount in everyoneItemCount.items():
+            while len(player.pieces) < itemCount:
+                itemIdx = self.room.rand.randrange(0, len(everyoneItemList))
+                player.pieces.append(CommandPiece(everyoneItemList[itemIdx]))
+                del everyoneItemList[itemIdx]
+
+    @handler(mysteryHandlers, "MOON")
+    def mysteryMoon(self, state: QueueState):
+        for player in self.room.players:
+            player.assistant = Assistant.createRandom(player)
+
+    @handler(queueKindHandlers, "SET_ASSISTANT")
+    def queueSetAssistant(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        assert len(atkData.pieceList) == 1 + (1 if isMagicFree else 0)
+        if self.room.forceNextAssistant is not None:
+            atkData.decidedAssistant = self.room.forceNextAssistant
+            self.room.forceNextAssistant = None
+        else:
+            atkData.decidedAssistant = self.room.rand.choice(Assistant.VALID_TYPES)
+
+    @handler(queueKindHandlers, "INCREASE_OR_DECREASE_HP")
+    def queueIncreaseOrDecreaseHP(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        assert len(state.atkData.pieceList) == 1
+        state.atkData.decidedHP = 10 if self.room.rand.randrange(0, 2) == 1 else -10
+
+    @handler(queueKindHandlers, "ADD_ITEM")
+    def queueAddItem(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        assert len(state.atkData.pieceList) == 2
+
+    @handler(queueExtraHandlers, "INCREASE_ATK")
+    def queueIncreaseAtk(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        if atkData.damage == -1:
+            atkData.damage = 0
+        atkData.damage += piece.item.getAtk()
+
+    @handler(queueExtraHandlers, "DOUBLE_ATK")
+    def queueDoubleAtk(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        assert atkData.attribute is not None
+        assert atkData.damage >= 0 and len(atkData.pieceList) > 1, "Tried to use DOUBLE_ATK alone"
+        atkData.damage *= 2
+
+    @handler(queueExtraHandlers, "WIDE_ATK")
+    def queueWideAtk(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        assert atkData.attribute is not None
+        assert atkData.damage >= 0 and len(atkData.pieceList) > 1, "Tried to use WIDE_ATK alone"
+        state.massiveAttack = True
+        atkData.chance = 100
+        atkData.attribute = ""
+
+    @handler(queueExtraHandlers, "MAGICAL")
+    def queueMagical(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        if atkData.assistantType is None:
+            state.magicalPiece = piece
+            piece.costMP = atkData.attacker.mp
+            atkData.damage = atkData.attacker.mp * 2
+        else:
+            piece.costMP = 100
+            atkData.damage = 200
+        atkData.extra.append(piece.item.attackExtra)
+
+    @handler(queueExtraHandlers, "PESTLE")
+    def queuePestle(self, state: QueueState, piece: CommandPiece, isMagicFree: bool):
+        atkData = state.atkData
+        assert len(atkData.pieceList) == 1
+        mortar = None
+        for player in self.room.players:
+            if player.dead:
+                continue
+            mortarPiece = player.getOwnedPieceById(245)
+            if mortarPiece is not None:
+                mortar = (player, mortarPiece)
+                break
+        if mortar is not None:
+            atkData.mortar = mortar[1]
+            atkData.damage = 999
+            atkData.defender = mortar[0]
+        else:
+            atkData.defender = self.room.getRandomAlive()
+        logger.debug("Mortar attack target selected.")
 
     def doAttack(self, atkData: Optional[AttackData] = None) -> bool:
         if atkData is not None:
             self.currentAttack = atkData
         else:
-            atkData = self.currentAttack = self.attackQueue.get()
-        missed = False if "DARK_CLOUD" in atkData.defender.harms else 0 < atkData.chance < random.randrange(1, 100 + 1)
+            atkData = self.currentAttack = self.attackQueue.popleft()
+        missed = False if "DARK_CLOUD" in atkData.defender.harms else 0 < atkData.chance < self.room.rand.randrange(1, 100 + 1)
 
         if atkData.defender.dead:
             assert atkData.chance != 0 or atkData.isCounter or atkData.assistantType, f"Dead being attacked! ({atkData}, Piece={atkData.pieceList})"
-            print("Attack skipped because defender is dead.")
+            logger.debug("Attack skipped because defender is dead.")
             return True
 
-        print(f"Current Attack: {atkData}")
+        logger.debug("Current Attack: %s", atkData)
 
         endInning = missed
         if atkData.attacker == atkData.defender:
@@ -400,7 +532,7 @@ class TurnHandler:
             if atkData.attacker != atkData.defender and atkData.defender.aiProcessor is not None:
                 return self.defenderCommand(atkData.defender, atkData.defender.aiProcessor.onDefenseTurn())
         else:
-            print("Attack missed!")
+            logger.debug("Attack missed!")
 
         return endInning
 
@@ -409,106 +541,19 @@ class TurnHandler:
 
         hasDamaged = atkData.damage > 0
         chain = False
-        print(f"InflictDamage: {atkData}")
+        logger.debug("InflictDamage: %s", atkData)
 
         for piece in atkData.pieceList:
             item = piece.item
-            if item.attackKind == "DISCARD":
-                assert atkData.attacker == atkData.defender
-                discardPieceList = [p for p in atkData.pieceList if p.item != item]
-                for discardPiece in discardPieceList:
-                    if discardPiece.item.attackExtra == "MORTAR":
-                        continue
-                    atkData.attacker.discardPiece(discardPiece)
-                break
-            elif item.attackKind == "EXCHANGE":
-                assert atkData.attacker == atkData.defender
-                assert atkData.decidedExchange is not None
-                atkData.attacker.hp = atkData.decidedExchange["HP"]
-                atkData.attacker.mp = atkData.decidedExchange["MP"]
-                atkData.attacker.yen = atkData.decidedExchange["YEN"]
-                break
-            elif item.attackKind == "SELL":
-                assert len(atkData.pieceList) == 2
-                sellItem = atkData.pieceList[1].item
-                print("Force buy:", sellItem)
-                atkData.defender.decreaseYen(sellItem.price)
-                atkData.defender.dealItem(sellItem.id, True)
-                atkData.attacker.increaseYen(sellItem.price)
-                break
-            elif item.attackKind == "ADD_ITEM":
-                assert len(atkData.pieceList) == 2
-                addItem = atkData.pieceList[1].item
-                print("Force deal item:", addItem)
-                atkData.defender.dealItem(addItem.id, True)
-                break
-
-            elif item.attackKind == "BUY":
-                chain = True
-                self.currentAttack.decidedPiece = atkData.decidedPiece = atkData.defender.getRandomPiece()
-                print(f"Decided item for \"{atkData.defender.name}\": {atkData.decidedPiece}")
-                break
-            elif item.attackKind == "REMOVE_ITEMS":  # Sweep away 1 item
-                chain = True
-                self.currentAttack.decidedPiece = atkData.decidedPiece = atkData.defender.getRandomPiece()
-                print(f"Decided item for \"{atkData.defender.name}\": {atkData.decidedPiece}")
-                if atkData.decidedPiece is not None:
-                    atkData.defender.discardPiece(atkData.decidedPiece)
-                break
-            elif item.attackKind == "REMOVE_ABILITIES": # Forget 1 miracle
-                chain = True
-                randomItem = self.server.itemManager.getItem(atkData.defender.getRandomMagic())
-                self.currentAttack.decidedPiece = atkData.decidedPiece = CommandPiece(randomItem) if randomItem.id != 0 else None
-                print(f"Decided item for \"{atkData.defender.name}\": {atkData.decidedPiece}")
-                if atkData.decidedPiece is not None:
-                    itemId = atkData.decidedPiece.item.id
-                    atkData.decidedPiece.abilityIndex = atkData.defender.magics.index(itemId)
-                    atkData.defender.discardMagic(itemId)
-                    for player in self.room.players:
-                        if player in [atkData.defender, atkData.attacker]:
-                            continue
-                        if player.aiProcessor is not None:
-                            player.aiProcessor.notifyMagicDiscard(atkData.defender, itemId)
+            # These kinds are the whole attack, they return if it chains.
+            pieceHandler = inflictChainHandlers.get(item.attackKind)
+            if pieceHandler is not None:
+                chain = pieceHandler(self, atkData, item)
                 break
 
-            if item.attackKind == "INCREASE_HP":
-                atkData.defender.increaseHP(item.value)
-            elif item.attackKind == "INCREASE_MP":
-                if atkData.decidedValue is not None:
-                    assert atkData.isCounter
-                    atkData.attacker.increaseMP(atkData.decidedValue)
-                else:
-                    atkData.defender.increaseMP(item.value)
-                if item.isAtkHarm():
-                    atkData.defender.addHarm(item.attackExtra)
-            elif item.attackKind == "INCREASE_YEN":
-                atkData.defender.increaseYen(item.value)
-            elif item.attackKind == "ABSORB_YEN":
-                if atkData.decidedValue is not None:
-                    assert atkData.isCounter
-                    atkData.attacker.increaseYen(atkData.decidedValue)
-                    atkData.defender.decreaseYen(atkData.decidedValue)
-                else:
-                    atkData.attacker.increaseYen(item.value)
-                    atkData.defender.decreaseYen(item.value)
-            elif item.attackKind == "SCATTER_YEN":
-                for player in self.room.players:
-                    player.increaseYen(item.value)
-            elif item.attackKind == "SET_ASSISTANT":
-                assert atkData.decidedAssistant is not None
-                atkData.defender.assistant = Assistant(atkData.defender, atkData.decidedAssistant)
-            elif item.attackKind == "INCREASE_OR_DECREASE_HP":
-                assert atkData.decidedHP is not None
-                if atkData.decidedHP < 0:
-                    atkData.defender.takeDamage(atkData.decidedHP * -1)
-                else:
-                    atkData.defender.increaseHP(atkData.decidedHP)
-            elif item.attackKind == "REMOVE_ALL_HARMS":
-                atkData.defender.removeAllHarms()
-            elif item.attackKind == "REMOVE_LOWER_HARMS":
-                atkData.defender.removeAllHarms(True)
-            elif item.attackKind == "ADD_HARM":
-                atkData.defender.addHarm(item.attackExtra)
+            pieceHandler = inflictEffectHandlers.get(item.attackKind)
+            if pieceHandler is not None:
+                pieceHandler(self, atkData, item)
             elif hasDamaged:
                 if item.isAtkHarm():
                     atkData.defender.addHarm(item.attackExtra)
@@ -525,14 +570,141 @@ class TurnHandler:
 
         return chain
 
+    @handler(inflictChainHandlers, "DISCARD")
+    def inflictDiscard(self, atkData: AttackData, item: Item) -> bool:
+        assert atkData.attacker == atkData.defender
+        discardPieceList = [p for p in atkData.pieceList if p.item != item]
+        for discardPiece in discardPieceList:
+            if discardPiece.item.attackExtra == "MORTAR":
+                continue
+            atkData.attacker.discardPiece(discardPiece)
+        return False
+
+    @handler(inflictChainHandlers, "EXCHANGE")
+    def inflictExchange(self, atkData: AttackData, item: Item) -> bool:
+        assert atkData.attacker == atkData.defender
+        assert atkData.decidedExchange is not None
+        atkData.attacker.hp = atkData.decidedExchange["HP"]
+        atkData.attacker.mp = atkData.decidedExchange["MP"]
+        atkData.attacker.yen = atkData.decidedExchange["YEN"]
+        return False
+
+    @handler(inflictChainHandlers, "SELL")
+    def inflictSell(self, atkData: AttackData, item: Item) -> bool:
+        assert len(atkData.pieceList) == 2
+        sellItem = atkData.pieceList[1].item
+        logger.debug("Force buy: %s", sellItem)
+        atkData.defender.decreaseYen(sellItem.price)
+        atkData.defender.dealItem(sellItem.id, True)
+        atkData.attacker.increaseYen(sellItem.price)
+        return False
+
+    @handler(inflictChainHandlers, "ADD_ITEM")
+    def inflictAddItem(self, atkData: AttackData, item: Item) -> bool:
+        assert len(atkData.pieceList) == 2
+        addItem = atkData.pieceList[1].item
+        logger.debug("Force deal item: %s", addItem)
+        atkData.defender.dealItem(addItem.id, True)
+        return False
+
+    @handler(inflictChainHandlers, "BUY")
+    def inflictBuy(self, atkData: AttackData, item: Item) -> bool:
+        assert self.currentAttack is not None
+        self.currentAttack.decidedPiece = atkData.decidedPiece = atkData.defender.getRandomPiece()
+        logger.debug("Decided item for \"%s\": %s", atkData.defender.name, atkData.decidedPiece)
+        return True
+
+    @handler(inflictChainHandlers, "REMOVE_ITEMS") # Sweep away 1 item
+    def inflictRemoveItems(self, atkData: AttackData, item: Item) -> bool:
+        assert self.currentAttack is not None
+        self.currentAttack.decidedPiece = atkData.decidedPiece = atkData.defender.getRandomPiece()
+        logger.debug("Decided item for \"%s\": %s", atkData.defender.name, atkData.decidedPiece)
+        if atkData.decidedPiece is not None:
+            atkData.defender.discardPiece(atkData.decidedPiece)
+        return True
+
+    @handler(inflictChainHandlers, "REMOVE_ABILITIES") # Forget 1 miracle
+    def inflictRemoveAbilities(self, atkData: AttackData, item: Item) -> bool:
+        assert self.currentAttack is not None
+        randomItem = self.server.itemManager.getItem(atkData.defender.getRandomMagic())
+        self.currentAttack.decidedPiece = atkData.decidedPiece = CommandPiece(randomItem) if randomItem.id != 0 else None
+        logger.debug("Decided item for \"%s\": %s", atkData.defender.name, atkData.decidedPiece)
+        if atkData.decidedPiece is not None:
+            itemId = atkData.decidedPiece.item.id
+            atkData.decidedPiece.abilityIndex = atkData.defender.magics.index(itemId)
+            atkData.defender.discardMagic(itemId)
+            for player in self.room.players:
+                if player in [atkData.defender, atkData.attacker]:
+                    continue
+                if player.aiProcessor is not None:
+                    player.aiProcessor.notifyMagicDiscard(atkData.defender, itemId)
+        return True
+
+    @handler(inflictEffectHandlers, "INCREASE_HP")
+    def inflictIncreaseHP(self, atkData: AttackData, item: Item):
+        atkData.defender.increaseHP(item.value)
+
+    @handler(inflictEffectHandlers, "INCREASE_MP")
+    def inflictIncreaseMP(self, atkData: AttackData, item: Item):
+        if atkData.decidedValue is not None:
+            assert atkData.isCounter
+            atkData.attacker.increaseMP(atkData.decidedValue)
+        else:
+            atkData.defender.increaseMP(item.value)
+        if item.isAtkHarm():
+            atkData.defender.addHarm(item.attackExtra)
+
+    @handler(inflictEffectHandlers, "INCREASE_YEN")
+    def inflictIncreaseYen(self, atkData: AttackData, item: Item):
+        atkData.defender.increaseYen(item.value)
+
+    @handler(inflictEffectHandlers, "ABSORB_YEN")
+    def inflictAbsorbYen(self, atkData: AttackData, item: Item):
+        if atkData.decidedValue is not None:
+            assert atkData.isCounter
+            atkData.attacker.increaseYen(atkData.decidedValue)
+            atkData.defender.decreaseYen(atkData.decidedValue)
+        else:
+            atkData.attacker.increaseYen(item.value)
+            atkData.defender.decreaseYen(item.value)
+
+    @handler(inflictEffectHandlers, "SCATTER_YEN")
+    def inflictScatterYen(self, atkData: AttackData, item: Item):
+        for player in self.room.players:
+            player.increaseYen(item.value)
+
+    @handler(inflictEffectHandlers, "SET_ASSISTANT")
+    def inflictSetAssistant(self, atkData: AttackData, item: Item):
+        assert atkData.decidedAssistant is not None
+        atkData.defender.assistant = Assistant(atkData.defender, atkData.decidedAssistant)
+
+    @handler(inflictEffectHandlers, "INCREASE_OR_DECREASE_HP")
+    def inflictIncreaseOrDecreaseHP(self, atkData: AttackData, item: Item):
+        assert atkData.decidedHP is not None
+        if atkData.decidedHP < 0:
+            atkData.defender.takeDamage(atkData.decidedHP * -1)
+        else:
+            atkData.defender.increaseHP(atkData.decidedHP)
+
+    @handler(inflictEffectHandlers, "REMOVE_ALL_HARMS")
+    def inflictRemoveAllHarms(self, atkData: AttackData, item: Item):
+        atkData.defender.removeAllHarms()
+
+    @handler(inflictEffectHandlers, "REMOVE_LOWER_HARMS")
+    def inflictRemoveLowerHarms(self, atkData: AttackData, item: Item):
+        atkData.defender.removeAllHarms(True)
+
+    @handler(inflictEffectHandlers, "ADD_HARM")
+    def inflictAddHarm(self, atkData: AttackData, item: Item):
+        atkData.defender.addHarm(item.attackExtra)
+
     def attackerCommand(self, player: Player, pieceList: list[CommandPiece], target: Player, decidedExchange: Optional[dict[str, int]] = None):
         if self.currentAttack is None:
             assert player == self.attacker
         else:
             assert player == self.currentAttack.attacker
 
-        print("New Attacker Command!")
-        print(f"Used: {pieceList}")
+        logger.debug("New Attacker Command! Used: %s", pieceList)
 
         newAttack = AttackData(player, target, pieceList)
         newAttack.decidedExchange = decidedExchange
@@ -545,11 +717,10 @@ class TurnHandler:
         atkData = self.currentAttack.clone()
         assert player == atkData.defender
 
-        print("New Defender Command!")
-        print("Used:", str(pieceList))
+        logger.debug("New Defender Command! Used: %s", pieceList)
 
         self.convertPiecesToOwnedPieces(player, pieceList)
-        print("Used (Owned):", str(pieceList))
+        logger.debug("Used (Owned): %s", pieceList)
 
         magicFreeIdxList: list[int] = []
         for idx, piece in enumerate(pieceList):
@@ -595,21 +766,21 @@ class TurnHandler:
                (item.defenseExtra == "REFLECT_MAGIC" and atkData.pieceList[0].item.type == "MAGIC") or\
                 item.defenseExtra == "REFLECT_ANY":
                 reflected = True
-                print("Current Attack Reflected!")
+                logger.debug("Current Attack Reflected!")
                 self.currentAttack.attacker, self.currentAttack.defender = self.currentAttack.defender, self.currentAttack.attacker
                 atkData = self.currentAttack.clone()
                 break
             elif (item.defenseExtra == "FLICK_WEAPON" and atkData.pieceList[0].item.type == "WEAPON") or\
                  (item.defenseExtra == "FLICK_MAGIC" and atkData.pieceList[0].item.type == "MAGIC"):
                 flicked = True
-                print("Current Attack Flicked!")
+                logger.debug("Current Attack Flicked!")
                 self.currentAttack.attacker, self.currentAttack.defender = self.currentAttack.defender, self.room.getRandomAlive()
                 atkData = self.currentAttack.clone()
                 break
             elif (item.defenseExtra == "BLOCK_WEAPON" and atkData.pieceList[0].item.type == "WEAPON") or\
                  (item.defenseExtra == "BLOCK_MAGIC" and atkData.pieceList[0].item.type == "MAGIC"):
                 blocked = True
-                print("Current Attack Blocked!")
+                logger.debug("Current Attack Blocked!")
                 break
             if item.defenseKind == "DFS":
                 if item.isDefHarm():
@@ -629,7 +800,7 @@ class TurnHandler:
                     item = piece.item
                     if item.defenseKind != "COUNTER":
                         continue
-                    print("Counter attack!")
+                    logger.debug("Counter attack!")
                     target = atkData.attacker if item.attackKind != "INCREASE_MP" else atkData.defender
                     newAttack = AttackData(atkData.defender, target, [piece])
                     piece.illusionItem = None
@@ -642,10 +813,10 @@ class TurnHandler:
 
             chain = self.inflictDamage(atkData)
             if atkData.attacker == atkData.defender:
-                print("Self attack, no defense!")
+                logger.debug("Self attack, no defense!")
                 return True
             if atkData.mortar is not None:
-                print("Mortar attack, no defense!")
+                logger.debug("Mortar attack, no defense!")
                 return True
 
         builder = XMLBuilder("COMMAND")
@@ -1,78 +1,162 @@
 # type: ignore[reportGeneralTypeIssues]
 from __future__ import annotations
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Optional
 if TYPE_CHECKING:
+    from twisted.internet.interfaces import IDelayedCall
     from server import Server
-from helpers.xmltodict import parse as xmltodict
+from modules.requestParser import parseRequest
 from modules.session import Session
+from modules.roomWorkerPool import FrontSession
+from modules.encodedXml import EncodedXml
+from modules.logs import PROTOCOL_LOGGER
 
-from twisted.internet import protocol
+from twisted.internet import interfaces, protocol, reactor
 from autobahn.twisted import websocket
+from zope.interface import implementer
+import logging
 
 __all__ = ("User", "WebSocketUser")
 
+logger = logging.getLogger(__name__)
+protocolLogger = logging.getLogger(PROTOCOL_LOGGER)
 
+
+@implementer(interfaces.IPushProducer)
 class User(protocol.Protocol):
     server: Server
-    recvd: str
+    recvd: bytearray
     ipAddress: str
     session: Optional[Session]
+    outbox: list[EncodedXml]
+    outboxSize: int
+    writePaused: bool
+    writeAborted: bool
+    flushCall: Optional[IDelayedCall]
 
     __slots__ = tuple(__annotations__)
 
     def __init__(self):
-        self.recvd = str()
+        self.recvd = bytearray()
         self.session = None
+        self.outbox = list()
+        self.outboxSize = 0
+        self.writePaused = False
+        self.writeAborted = False
+        self.flushCall = None
 
     def connectionMade(self):
         self.server = self.factory
         self.ipAddress = self.transport.getPeer().host
+        # The transport pauses us when the client isn't reading fast enough.
+        self.transport.registerProducer(self, True)
 
     def connectionLost(self, reason):
         if self.session is not None:
             self.session.onDisconnect()
     
     def dataReceived(self, data):
-        data = data.decode()
+        self.recvd += data
+
+        # Handle every complete NUL-terminated message, the partial tail waits for more data.
+        start = 0
+        while (end := self.recvd.find(b"\0", start)) != -1:
+            frame = self.recvd[start:end]
+            start = end + 1
+            if len(frame) > self.server.maxFrameSize:
+                self.dropOversizedFrame(len(frame))
+                return
+            if not self.frameReceived(frame):
+                self.recvd.clear()
+                return
+        del self.recvd[:start]
+
+        if len(self.recvd) > self.server.maxFrameSize:
+            self.dropOversizedFrame(len(self.recvd))
 
-        if data == "<policy-file-request/>\0":
+    def frameReceived(self, frame: bytearray) -> bool:
+        if len(frame) == 0:
+            return True
+
+        if frame == b"<policy-file-request/>":
             self.sendPayload(b"<cross-domain-policy><allow-access-from domain=\"*\" to-ports=\"*\" /></cross-domain-policy>\0")
+            self.flushOutbox()
             self.transport.loseConnection()
-            return
+            return False
 
-        self.recvd += data
+        self.parseXml(frame.decode().replace("\n", " "))
+        return True
 
-        if not data.endswith("\0"):
-            return
+    def dropOversizedFrame(self, size: int):
+        logger.warning("Dropping %s, message of %d bytes exceeds the %d bytes limit.", self.ipAddress, size, self.server.maxFrameSize)
+        self.recvd.clear()
+        self.transport.loseConnection()
+
+    def pauseProducing(self):
+        self.writePaused = True
 
-        xmls = self.recvd.split("\0")
-        for xml in xmls:
-            if len(xml) == 0:
-                break
-            xml = xml.replace("\n", " ")
-            self.parseXml(xml)
+    def resumeProducing(self):
+        self.writePaused = False
+        self.flushOutbox()
 
-        self.recvd = str()
+    def stopProducing(self):
+        if self.flushCall is not None:
+            self.flushCall.cancel()
+            self.flushCall = None
+        self.outbox.clear()
+        self.outboxSize = 0
 
-    def sendPayload(self, payload):
-        self.transport.write(payload)
+    def sendPayload(self, payload: bytes):
+        self.sendEncodedPayload(EncodedXml(payload))
 
     def sendXml(self, xml):
-        if self.session is not None:
-            print(f"SEND ({self.session.userName}): {repr(str(xml))}")
-        self.sendPayload((str(xml) + chr(0)).encode())
+        self.sendEncodedXml(EncodedXml.fromXml(xml))
+
+    def sendEncodedXml(self, encoded: EncodedXml):
+        if self.session is not None and protocolLogger.isEnabledFor(logging.DEBUG):
+            protocolLogger.debug("SEND (%s): %r", self.session.userName, encoded.xml)
+        self.sendEncodedPayload(encoded)
+
+    def sendEncodedPayload(self, encoded: EncodedXml):
+        if self.writeAborted:
+            return
+
+        # Everything sent during a reactor turn is written at once when it ends, or when the
+        # transport drains if the client is slow, up to a limit.
+        self.outbox.append(encoded)
+        self.outboxSize += len(encoded.data)
+        if self.outboxSize > self.server.maxOutboxSize:
+            logger.warning("Dropping %s, %d bytes are waiting to be sent, more than the %d bytes limit.", self.ipAddress, self.outboxSize, self.server.maxOutboxSize)
+            self.stopProducing()
+            self.writeAborted = True
+            self.transport.abortConnection()
+            return
+
+        if not self.writePaused and self.flushCall is None:
+            self.flushCall = reactor.callLater(0, self.flushOutbox)
+
+    def flushOutbox(self):
+        if self.flushCall is not None:
+            if self.flushCall.active():
+                self.flushCall.cancel()
+            self.flushCall = None
+        if self.writePaused or len(self.outbox) == 0:
+            return
+
+        pending = self.outbox
+        self.outbox = list()
+        self.outboxSize = 0
+        self.writePayloads(pending)
+
+    def writePayloads(self, payloads: list[EncodedXml]):
+        self.transport.write(b"".join(encoded.data for encoded in payloads))
 
     def parseXml(self, xml: str):
-        xmldict: Any = xmltodict(xml)
-        request = list(xmldict.keys())[0]
-        xmldict = list(xmldict.values())[0] if list(xmldict.values())[0] != None else dict()
+        request, xmldict = parseRequest(xml)
 
-        #print repr(xml)
-        print(f"RECV \"{request}\" from {self.session.userName if self.session else '?'}: {xmldict}")
+        protocolLogger.debug("RECV \"%s\" from %s: %s", request, self.session.userName if self.session else '?', xmldict)
 
         if request == "ERROR":
-            print(repr(xml))
-            print(request, xmldict)
+            logger.warning("Client error from %s: %r", self.session.userName if self.session else '?', xml)
 
         elif request == "LOGIN":
             if self.session is not None:
@@ -87,7 +171,7 @@ class User(protocol.Protocol):
 
             serverMode = self.server.getServerType(self.transport.getHost())
 
-            self.session = Session(self, xmldict)
+            self.session = (Session if self.server.roomWorkers is None else FrontSession)(self, xmldict)
             self.session.onLogin(serverMode)
 
         else:
@@ -112,7 +196,9 @@ class WebSocketUser(websocket.WebSocketServerProtocol, User):
         assert isBinary, "Binary message expected."
         User.dataReceived(self, payload)
 
-    def sendPayload(self, payload):
+    def writePayloads(self, payloads: list[EncodedXml]):
         if self.state != websocket.protocol.WebSocketProtocol.STATE_OPEN:
             return
-        self.sendMessage(payload, True)
\ No newline at end of file
+        # One WebSocket message per XML document, like before the outbox.
+        for encoded in payloads:
+            self.sendPreparedMessage(encoded.getPreparedMessage(self.factory))
\ No newline at end of file
@@ -6,36 +6,64 @@ if TYPE_CHECKING:
 from modules.user import User, WebSocketUser
 from modules.room import Room
 from modules.item import ItemManager
+from modules.roomWorkerPool import RoomWorkerPool
+from modules.lobbyBroadcaster import LobbyBroadcaster
+from modules.encodedXml import EncodedXml
+from modules.templates import Templates
+from modules.logs import setupLogging
 from helpers.xmlbuilder import XMLBuilder
 
 import argparse
+import logging
 from twisted.internet import reactor, protocol
 from autobahn.twisted import websocket
 
 __all__ = ("Server",)
 
+logger = logging.getLogger("server")
+
 
 class Server(protocol.ServerFactory):
     mode: str
     language: str
     serverNumber: int
-    users: list[Session]
+    users: dict[str, Session]
     rooms: dict[int, Room]
+    playerRooms: dict[str, list[Room]]
+    lobbyVersion: int
+    lobbySnapshot: Optional[EncodedXml]
+    lobbySnapshotVersion: int
     lastRoomId: int
+    maxFrameSize: int
+    maxOutboxSize: int
+    inningSliceBudget: Optional[float]
+    roomWorkers: Optional[RoomWorkerPool]
+    lobbyBroadcaster: Optional[LobbyBroadcaster]
     itemManager: ItemManager
     typesPorts: dict[str, int]
 
+    DEFAULT_MAX_FRAME_SIZE = 65536
+    DEFAULT_MAX_OUTBOX_SIZE = 1048576
     __slots__ = tuple(__annotations__)
 
     protocol = User
 
-    def __init__(self, mode: str, language: str, serverNumber: int):
+    def __init__(self, mode: str, language: str, serverNumber: int, maxFrameSize: int = DEFAULT_MAX_FRAME_SIZE, maxOutboxSize: int = DEFAULT_MAX_OUTBOX_SIZE):
         self.mode = mode
         self.language = language
         self.serverNumber = serverNumber
-        self.users = list()
+        self.users = dict()
         self.rooms = dict()
+        self.playerRooms = dict()
+        self.lobbyVersion = 0
+        self.lobbySnapshot = None
+        self.lobbySnapshotVersion = -1
         self.lastRoomId = 0
+        self.maxFrameSize = maxFrameSize
+        self.maxOutboxSize = maxOutboxSize
+        self.inningSliceBudget = None
+        self.roomWorkers = None
+        self.lobbyBroadcaster = None
 
         self.itemManager = ItemManager("ItemData.CSV", "AssistantItemData.CSV")
 
@@ -50,7 +78,7 @@ class Server(protocol.ServerFactory):
         setServerType("SPIRIT", 58400)
         
         if self.mode != "ANY" and self.mode not in self.typesPorts:
-            print(f"WARNING: Invalid server mode \"{self.mode}\", using default server mode (ANY).")
+            logger.warning("Invalid server mode \"%s\", using default server mode (ANY).", self.mode)
             self.mode = "ANY"
 
     def getServerType(self, host) -> str:
@@ -61,26 +89,60 @@ class Server(protocol.ServerFactory):
                 return type
         
     def getUser(self, name: str) -> Optional[Session]:
-        for user in self.users:
-            if user is not None and user.userName == name:
-                return user
-        return None
+        return self.users.get(name)
 
     def getRoom(self, id: int) -> Optional[Room]:
         if id in self.rooms:
             return self.rooms[id]
         return None
 
-    def lobbyBroadXml(self, xml):
-        for user in self.users:
-            if user is not None and user.state == "LOBBY":
-                user.sendXml(xml)
+    def getPlayerRoom(self, name: str) -> Optional[Room]:
+        """The first playing room with a player of that name."""
+        # Names repeat across rooms: the training bots all have the same few.
+        return min((room for room in self.playerRooms.get(name, ()) if room.playing), key=lambda room: room.id, default=None)
+
+    def indexPlayer(self, name: str, room: Room):
+        rooms = self.playerRooms.setdefault(name, list())
+        if room not in rooms:
+            rooms.append(room)
+
+    def unindexPlayer(self, name: str, room: Room):
+        rooms = self.playerRooms.get(name)
+        if rooms is None or room not in rooms:
+            return
+        rooms.remove(room)
+        if len(rooms) == 0:
+            del self.playerRooms[name]
+
+    def lobbyBroadXml(self, xml, key: Optional[tuple] = None, cancels: Optional[tuple] = None, subject: Optional[str] = None):
+        """The keys are only used to merge events when a lobby broadcaster is set, see LobbyBroadcaster."""
+        if self.lobbyBroadcaster is not None:
+            self.lobbyBroadcaster.queue(EncodedXml.fromXml(xml), key, cancels, subject)
+            return
+
+        encoded: Optional[EncodedXml] = None
+        for user in self.users.values():
+            if user.state == "LOBBY":
+                if encoded is None:
+                    encoded = EncodedXml.fromXml(xml)
+                user.sendEncodedXml(encoded)
+
+    def invalidateLobby(self):
+        """Called on every change of what the lobby lists: users, rooms, their players and their state."""
+        self.lobbyVersion += 1
+
+    def getLobbySnapshot(self) -> EncodedXml:
+        # Everyone going to the lobby between two changes gets the same bytes.
+        if self.lobbySnapshot is None or self.lobbySnapshotVersion != self.lobbyVersion:
+            self.lobbySnapshot = EncodedXml.fromXml(self.buildLobbyXml())
+            self.lobbySnapshotVersion = self.lobbyVersion
+        return self.lobbySnapshot
 
     def buildLobbyXml(self) -> XMLBuilder:
         builder = XMLBuilder("ENTER")
         builder.lobby  # <lobby />
 
-        for user in self.users:
+        for user in self.users.values():
             bUser = builder.user
             bUser.name(user.userName)
             if user.room is not None:
@@ -107,18 +169,19 @@ class Server(protocol.ServerFactory):
         return builder
 
     def addUser(self, user: Session):
-        self.users.append(user)
+        self.users[user.userName] = user
+        self.invalidateLobby()
 
-        builder = XMLBuilder("ADD_USER")
-        builder.user.name(user.userName)
-        self.lobbyBroadXml(builder)
+        self.lobbyBroadXml(Templates.ADD_USER.render(user.userName), key=("USER", user.userName))
 
     def removeUser(self, user: Session):
-        self.users.remove(user)
+        if self.users.get(user.userName) is user:
+            del self.users[user.userName]
+            self.invalidateLobby()
+        if self.lobbyBroadcaster is not None:
+            self.lobbyBroadcaster.removeEntrant(user)
 
-        builder = XMLBuilder("REMOVE_USER")
-        builder.user.name(user.userName)
-        self.lobbyBroadXml(builder)
+        self.lobbyBroadXml(Templates.REMOVE_USER.render(user.userName), cancels=("USER", user.userName))
 
     def createRoom(self, name: str, password: str = "", serverMode: str = "") -> Room:
         if serverMode == "":
@@ -130,15 +193,23 @@ class Server(protocol.ServerFactory):
         self.lastRoomId += 1
         self.rooms[self.lastRoomId] = room
         room.id = self.lastRoomId
+        self.invalidateLobby()
 
         return room
+
+    def removeRoom(self, room: Room):
+        room.stopAdvancing()
+        del self.rooms[room.id]
+        for player in room.players:
+            self.unindexPlayer(player.name, room)
+        self.invalidateLobby()
     
 class WebSocketServer(websocket.WebSocketServerFactory, Server):
     protocol = WebSocketUser
 
-    def __init__(self, mode: str, language: str, serverNumber: int):
+    def __init__(self, mode: str, language: str, serverNumber: int, maxFrameSize: int = Server.DEFAULT_MAX_FRAME_SIZE, maxOutboxSize: int = Server.DEFAULT_MAX_OUTBOX_SIZE):
         websocket.WebSocketServerFactory.__init__(self)
-        Server.__init__(self, mode, language, serverNumber)
+        Server.__init__(self, mode, language, serverNumber, maxFrameSize, maxOutboxSize)
 
 def main():
     parser = argparse.ArgumentParser(description="GodField Server")
@@ -146,13 +217,33 @@ def main():
     parser.add_argument('--language', type=str, default="EN", help='Server language (default: EN)')
     parser.add_argument('--number', type=int, default=1, help='Server number (default: 1)')
     parser.add_argument('--ws', action='store_true', help='Enable WebSocket mode (default: False)')
+    parser.add_argument('--log-level', type=str, default="INFO", help='Log level (default: INFO)')
+    parser.add_argument('--trace-protocol', action='store_true', help='Log every sent and received message (default: False)')
+    parser.add_argument('--log-thread', action='store_true', help='Write logs from a background thread (default: False)')
+    parser.add_argument('--max-outbox-size', type=int, default=Server.DEFAULT_MAX_OUTBOX_SIZE, help=f'Maximum bytes waiting to be sent to a slow client before dropping it (default: {Server.DEFAULT_MAX_OUTBOX_SIZE})')
+    parser.add_argument('--slice-budget', type=float, default=5.0, help='Milliseconds a room may play bot turns before letting other work run, negative to never pause (default: 5)')
+    parser.add_argument('--room-workers', type=int, default=0, help='Run the rooms in this many worker processes, 0 to run them in the server process (default: 0)')
+    parser.add_argument('--lobby-tick', type=float, default=0, help='Send the lobby events in batches every this many milliseconds, 0 to send them right away (default: 0)')
+    parser.add_argument('--max-frame-size', type=int, default=Server.DEFAULT_MAX_FRAME_SIZE, help=f'Maximum size in bytes of a client message (default: {Server.DEFAULT_MAX_FRAME_SIZE})')
 
     args = parser.parse_args()
 
+    setupLogging(args.log_level, args.trace_protocol, args.log_thread)
+
     if args.ws:
-        factory = WebSocketServer(args.mode, args.language, args.number)
+        factory = WebSocketServer(args.mode, args.language, args.number, args.max_frame_size, args.max_outbox_size)
     else:
-        factory = Server(args.mode, args.language, args.number)
+        factory = Server(args.mode, args.language, args.number, args.max_frame_size, args.max_outbox_size)
+
+    if args.slice_budget >= 0:
+        factory.inningSliceBudget = args.slice_budget / 1000
+
+    if args.lobby_tick > 0:
+        factory.lobbyBroadcaster = LobbyBroadcaster(factory, args.lobby_tick / 1000)
+
+    if args.room_workers > 0:
+        factory.roomWorkers = RoomWorkerPool(factory, args.room_workers, args.log_level)
+        factory.roomWorkers.start()
 
     if factory.mode == "ANY":
         for port in factory.typesPorts.values():
@@ -160,7 +251,7 @@ def main():
     else:
         reactor.listenTCP(factory.typesPorts[factory.mode], factory)
 
-    print("Server listening for new connections")
+    logger.info("Server listening for new connections")
     reactor.run()
 
 # this only runs if the module was *not* imported
@@ -0,0 +1,157 @@
+"""
+Plays bot-only games without any network and reports the engine throughput.
+
+Run from the server-src folder:
+    python simulator.py --games 1000 --bots 4
+    python simulator.py --games 100000 --workers 0 --seed 42
+    python simulator.py --replay 1234567890
+"""
+from __future__ import annotations
+from typing import Optional
+from server import Server
+from modules.simulation import MatchResult, Simulator
+from modules.logs import setupLogging
+from modules.turn import enableHandlerTimings, getHandlerTimings
+
+import argparse
+import collections
+import concurrent.futures
+import numpy
+import os
+import random
+import statistics
+import time
+
+
+# Each worker process builds its own server, and so its own ItemManager, once.
+workerSimulator: Optional[Simulator] = None
+
+def initWorker(botCount: int, teamCount: int, logLevel: str):
+    global workerSimulator
+    setupLogging(logLevel)
+    workerSimulator = Simulator(Server("ANY", "EN", 1), botCount, teamCount)
+
+def runBatch(batch: tuple[int, int]) -> list[MatchResult]:
+    seed, count = batch
+    assert workerSimulator is not None
+    workerSimulator.reseed(seed)
+    return workerSimulator.runGames(count)
+
+def makeBatches(seed: int, games: int, batchSize: int) -> list[tuple[int, int]]:
+    # Every batch gets its own seed derived from the run seed, so the results don't depend on
+    # the number of workers or on which worker picks which batch.
+    batches = list()
+    for idx, start in enumerate(range(0, games, batchSize)):
+        batchSeed = int(numpy.random.SeedSequence((seed, idx)).generate_state(1, numpy.uint64)[0])
+        batches.append((batchSeed, min(batchSize, games - start)))
+    return batches
+
+
+def printReport(allResults: list[MatchResult], elapsed: float, workers: int, bucketSize: int):
+    results = [result for result in allResults if result.error is None]
+    failed = [result for result in allResults if result.error is not None]
+    if len(failed) > 0:
+        printFailures(failed)
+        print()
+    if len(results) == 0:
+        return
+
+    games = len(results)
+    innings = [result.innings for result in results]
+    totalInnings = sum(innings)
+    gamesTime = sum(result.elapsed for result in results)
+
+    print(f"Games:   {games} in {elapsed:.2f}s, {games / elapsed:.1f} games/s")
+    print(f"Innings: {totalInnings}, {totalInnings / elapsed:.1f} innings/s, {gamesTime / totalInnings * 1e6:.1f} us/inning")
+    print(f"Workers: {workers}, {gamesTime / elapsed:.2f}x parallel speedup")
+    slowest = max(results, key=lambda result: result.elapsed)
+    print(f"Slowest game: {slowest.elapsed * 1e3:.1f} ms, {slowest.innings} innings, seed {slowest.seed}")
+
+    print()
+    print(f"Innings per game: min {min(innings)}  mean {statistics.mean(innings):.1f}  median {statistics.median(innings):g}  max {max(innings)}")
+    buckets = collections.Counter(count // bucketSize for count in innings)
+    for bucket in range(min(buckets), max(buckets) + 1):
+        count = buckets[bucket]
+        label = f"{bucket * bucketSize}-{(bucket + 1) * bucketSize - 1}"
+        print(f"  {label:>9} {count:7d} {count / games * 100:6.1f}% {'#' * round(count / games * 50)}")
+
+    print()
+    print("Winners:")
+    for winner, count in sorted(collections.Counter(result.winner for result in results).items()):
+        print(f"  {winner:>9} {count:7d} {count / games * 100:6.1f}%")
+
+    print()
+    print("Final stats (mean):")
+    for seat, name in enumerate(player[0] for player in results[0].players):
+        hp, mp, yen = (statistics.mean(result.players[seat][stat] for result in results) for stat in range(1, 4))
+        print(f"  {name:>9}  HP {hp:5.1f}  MP {mp:5.1f}  YEN {yen:5.1f}")
+
+def printFailures(failed: list[MatchResult]):
+    print(f"Failed: {len(failed)} games, replay one with --replay SEED")
+    for result in sorted(failed, key=lambda result: result.seed):
+        assert result.error is not None
+        print(f"  seed {result.seed}: {result.error.strip().splitlines()[-1]}")
+
+def printHandlerTimings():
+    timings = getHandlerTimings()
+    print()
+    print("Attack handlers (by total time):")
+    for name, (calls, seconds) in sorted(timings.items(), key=lambda timing: timing[1][1], reverse=True):
+        print(f"  {name:>36} {calls:9d} calls {seconds * 1e3:9.1f} ms {seconds / calls * 1e6:7.2f} us/call")
+
+def main():
+    parser = argparse.ArgumentParser(description="GodField headless match simulator")
+    parser.add_argument('--games', type=int, default=1000, help='Number of games to play (default: 1000)')
+    parser.add_argument('--bots', type=int, default=4, help='Bots per game (default: 4)')
+    parser.add_argument('--teams', type=int, default=0, help='Split the bots in this many teams, 0 for free for all (default: 0)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed, for reproducible runs (default: random)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes, 0 for one per CPU (default: 1)')
+    parser.add_argument('--batch', type=int, default=50, help='Games per worker task (default: 50)')
+    parser.add_argument('--replay', type=int, default=None, help='Play only the game with this game seed (default: none)')
+    parser.add_argument('--bucket', type=int, default=10, help='Width of the innings histogram buckets (default: 10)')
+    parser.add_argument('--log-level', type=str, default="WARNING", help='Log level (default: WARNING)')
+    parser.add_argument('--handler-timings', action='store_true', help='Time the attack kind handlers, needs a single worker (default: False)')
+
+    args = parser.parse_args()
+    if args.handler_timings and args.workers != 1:
+        parser.error("--handler-timings needs --workers 1")
+
+    setupLogging(args.log_level)
+    if args.handler_timings:
+        enableHandlerTimings()
+
+    if args.replay is not None:
+        initWorker(args.bots, args.teams, args.log_level)
+        assert workerSimulator is not None
+        result = workerSimulator.runGame(args.replay)
+        if result.error is not None:
+            print(result.error, end="")
+        print(f"Seed {result.seed}: {result.innings} innings in {result.elapsed * 1e3:.1f} ms, winner {result.winner}")
+        if args.handler_timings:
+            printHandlerTimings()
+        return
+
+    workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    batches = makeBatches(seed, args.games, args.batch)
+    print(f"Seed: {seed}")
+
+    results: list[MatchResult] = list()
+    start = time.perf_counter()
+    if workers == 1:
+        initWorker(args.bots, args.teams, args.log_level)
+        for batch in batches:
+            results.extend(runBatch(batch))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=initWorker, initargs=(args.bots, args.teams, args.log_level)) as executor:
+            futures = [executor.submit(runBatch, batch) for batch in batches]
+            for future in concurrent.futures.as_completed(futures):
+                results.extend(future.result())
+    elapsed = time.perf_counter() - start
+
+    printReport(results, elapsed, workers, args.bucket)
+    if args.handler_timings:
+        printHandlerTimings()
+
+if __name__ == '__main__':
+    main()